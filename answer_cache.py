@@ -0,0 +1,93 @@
+"""Cache semântico de respostas por chat, consultado antes da chamada ao LLM."""
+
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import embeddings
+
+ATIVO = os.getenv("ANSWER_CACHE", "1") != "0"
+# Similaridade de cosseno mínima entre perguntas para reaproveitar a resposta
+LIMIAR_SIMILARIDADE = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+TTL_SEGUNDOS = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+MAX_POR_CHAT = int(os.getenv("ANSWER_CACHE_MAX_PER_CHAT", "256"))
+
+# (vetor normalizado, impressão do contexto, resposta, criado_em)
+_Entrada = Tuple[np.ndarray, str, str, float]
+
+_entradas: Dict[int, List[_Entrada]] = {}
+_estatisticas = {"hits": 0, "misses": 0, "invalidacoes": 0}
+_lock = threading.Lock()
+
+
+def _impressao(contexto: List[str]) -> str:
+    """Identifica o conjunto (ordenado) de trechos usados no prompt."""
+    digest = hashlib.sha256()
+    for trecho in contexto:
+        digest.update(hashlib.sha256(trecho.encode("utf-8")).digest())
+    return digest.hexdigest()
+
+
+def _vetor(pergunta: str) -> np.ndarray:
+    vetor = embeddings.encode_consultas([pergunta])[0]
+    norma = float(np.linalg.norm(vetor)) or 1.0
+    return vetor / norma
+
+
+def buscar(chat_id: int, pergunta: str, contexto: List[str]) -> Optional[str]:
+    """Resposta já dada no chat para uma pergunta parecida com o mesmo contexto."""
+    if not ATIVO:
+        return None
+
+    impressao = _impressao(contexto)
+    vetor = _vetor(pergunta)
+    agora = time.time()
+    with _lock:
+        validas = [
+            entrada for entrada in _entradas.get(chat_id, [])
+            if agora - entrada[3] < TTL_SEGUNDOS
+        ]
+        _entradas[chat_id] = validas
+
+        melhor: Optional[str] = None
+        melhor_sim = LIMIAR_SIMILARIDADE
+        for vetor_salvo, impressao_salva, resposta, _ in validas:
+            if impressao_salva != impressao:
+                continue
+            similaridade = float(vetor_salvo @ vetor)
+            if similaridade >= melhor_sim:
+                melhor, melhor_sim = resposta, similaridade
+
+        _estatisticas["hits" if melhor is not None else "misses"] += 1
+        return melhor
+
+
+def guardar(chat_id: int, pergunta: str, contexto: List[str], resposta: str):
+    if not ATIVO or not resposta:
+        return
+
+    entrada = (_vetor(pergunta), _impressao(contexto), resposta, time.time())
+    with _lock:
+        lista = _entradas.setdefault(chat_id, [])
+        lista.append(entrada)
+        if len(lista) > MAX_POR_CHAT:
+            del lista[: len(lista) - MAX_POR_CHAT]
+
+
+def invalidar_chat(chat_id: int):
+    """Descarta as respostas do chat (ex.: novos arquivos foram indexados)."""
+    with _lock:
+        if _entradas.pop(chat_id, None):
+            _estatisticas["invalidacoes"] += 1
+
+
+def estatisticas() -> Dict[str, int]:
+    with _lock:
+        return {**_estatisticas, "entradas": sum(len(v) for v in _entradas.values())}
+
+
+__all__ = ["buscar", "guardar", "invalidar_chat", "estatisticas"]
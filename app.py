@@ -2,24 +2,51 @@ import datetime
 import os
 import tempfile
 import uuid
+from typing import Iterator
 
 import streamlit as st
 from groq import Groq
 from dotenv import load_dotenv
 
-from rag import carregar_arquivos, buscar_contexto, limpar_chat_contexto
+import answer_cache
+from rag import (
+    carregar_arquivos,
+    buscar_contexto,
+    limpar_chat_contexto,
+    aquecer_modelo,
+    definir_fonte_arquivos,
+    pre_carregar_em_segundo_plano,
+    reidratar_chat,
+)
 from database import (
     criar_chat,
     salvar_mensagem,
+    estado_mensagem,
+    chave_mensagem,
     buscar_historico,
     listar_chats,
-    salvar_arquivo,
+    sem_excluidos,
+    salvar_arquivos,
+    listar_arquivos,
+    baixar_arquivo,
     atualizar_titulo_chat,
     deletar_chat,
+    status_exclusao,
 )
 from filename_utils import sanitize_filename, sanitize_storage_path
+from background_tasks import executar_em_segundo_plano
 from chat_titles import generate_chat_title
-from auth import sign_up, sign_in, sign_out, get_current_user, set_session
+from context_packing import empacotar
+from model_router import FalhaNosModelos, executar_com_fallback
+from auth import (
+    sign_up,
+    sign_in,
+    sign_out,
+    get_current_user,
+    set_session,
+    ensure_session,
+    user_from_token,
+)
 
 # Carrega variáveis do .env
 load_dotenv()
@@ -30,15 +57,47 @@ if not api_key:
 
 # Cliente Groq
 client = Groq(api_key=api_key)
+# Chamadas roteadas: prazo, hedge e fallback ficam com o model_router, sem retries do SDK
+client_roteado = client.with_options(max_retries=0)
 
+# Exibe a resposta token a token (STREAM_RESPOSTAS=0 volta à resposta completa)
+STREAM_RESPOSTAS = os.getenv("STREAM_RESPOSTAS", "1") != "0"
 
-def gerar_resposta(chat_id: int, mensagem: str) -> str:
-    """Gera resposta usando o contexto recuperado via RAG."""
-    contexto = buscar_contexto(mensagem, chat_id, k=5)
+MODELOS = [
+    "llama-3.1-8b-instant",
+    "allam-2-7b"
+]
 
-    if not contexto:
-        return "Não há dados suficientes nos arquivos fornecidos para responder isso."
+# Trechos pedidos ao RAG antes do empacotamento por orçamento de tokens; acima do
+# que cabe no orçamento, para que empacotar() escolha e descarte quase-duplicatas
+CONTEXTO_K = int(os.getenv("RAG_CONTEXT_K", "20"))
+
+# Mensagens exibidas por vez; "Carregar anteriores" amplia a janela
+JANELA_HISTORICO = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+
+# Chats listados por página na barra lateral
+PAGINA_CHATS = int(os.getenv("CHATS_PAGE_SIZE", "30"))
+
+# Chats mais recentes reindexados em segundo plano logo após o login
+CHATS_PRE_CARREGADOS = int(os.getenv("RAG_PREFETCH_CHATS", "3"))
+
+SEM_DADOS = "Não há dados suficientes nos arquivos fornecidos para responder isso."
+SEM_MODELO = "Erro: nenhum modelo conseguiu responder."
+
+
+def _arquivos_do_chat(chat_id: int, access_token: str | None = None) -> list[tuple[str, str]]:
+    return [
+        (arquivo.get("file_name") or "", arquivo["path"])
+        for arquivo in listar_arquivos(chat_id, access_token)
+        if arquivo.get("path")
+    ]
+
+
+# Índices ausentes neste worker são reconstruídos a partir do bucket uploads
+definir_fonte_arquivos(_arquivos_do_chat, baixar_arquivo)
 
+
+def _montar_mensagens(contexto: list[str], mensagem: str) -> list[dict]:
     prompt = (
         "Responda SOMENTE com base nos trechos abaixo. "
         "Se a resposta não estiver nos trechos, diga que não há dados suficientes.\n\n"
@@ -47,28 +106,110 @@ def gerar_resposta(chat_id: int, mensagem: str) -> str:
         + "\n\nPergunta do usuário:\n"
         + mensagem
     )
-
-    modelos = [
-        "llama-3.1-8b-instant",
-        "allam-2-7b"
+    return [
+        {"role": "system", "content": "Responda estritamente usando apenas as informações dos documentos."},
+        {"role": "user", "content": prompt}
     ]
 
-    for modelo in modelos:
-        try:
-            response = client.chat.completions.create(
-                model=modelo,
-                messages=[
-                    {"role": "system", "content": "Responda estritamente usando apenas as informações dos documentos."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2,
-                max_tokens=300
-            )
-            return response.choices[0].message.content
-        except Exception as exc:
-            st.write(f"Falha no modelo {modelo}: {exc}")
 
-    return "Erro: nenhum modelo conseguiu responder."
+def gerar_resposta(chat_id: int, mensagem: str) -> str:
+    """Gera resposta usando o contexto recuperado via RAG."""
+    contexto = empacotar(buscar_contexto(mensagem, chat_id, k=CONTEXTO_K))
+
+    if not contexto:
+        return SEM_DADOS
+
+    em_cache = answer_cache.buscar(chat_id, mensagem, contexto)
+    if em_cache is not None:
+        return em_cache
+
+    mensagens = _montar_mensagens(contexto, mensagem)
+
+    def _chamar(modelo: str, prazo: float) -> str:
+        response = client_roteado.chat.completions.create(
+            model=modelo,
+            messages=mensagens,
+            temperature=0.2,
+            max_tokens=300,
+            timeout=prazo
+        )
+        return response.choices[0].message.content
+
+    try:
+        resposta = executar_com_fallback(MODELOS, _chamar)
+    except FalhaNosModelos as exc:
+        _exibir_falhas(exc)
+        return SEM_MODELO
+
+    answer_cache.guardar(chat_id, mensagem, contexto, resposta)
+    return resposta
+
+
+def _exibir_falhas(exc: FalhaNosModelos):
+    if not exc.erros:
+        st.write(f"Falha nos modelos: {exc}")
+    for modelo, erro in exc.erros:
+        st.write(f"Falha no modelo {modelo}: {erro}")
+
+
+def gerar_resposta_stream(chat_id: int, mensagem: str) -> Iterator[str]:
+    """Versão em streaming de gerar_resposta: entrega os tokens à medida que chegam.
+
+    Prazo, hedge e fallback valem até o primeiro token; depois disso o stream
+    vencedor segue até o fim e uma falha mantém o texto parcial já exibido.
+    """
+    contexto = empacotar(buscar_contexto(mensagem, chat_id, k=CONTEXTO_K))
+
+    if not contexto:
+        yield SEM_DADOS
+        return
+
+    em_cache = answer_cache.buscar(chat_id, mensagem, contexto)
+    if em_cache is not None:
+        yield em_cache
+        return
+
+    mensagens = _montar_mensagens(contexto, mensagem)
+
+    def _abrir_stream(modelo: str, prazo: float):
+        stream = client_roteado.chat.completions.create(
+            model=modelo,
+            messages=mensagens,
+            temperature=0.2,
+            max_tokens=300,
+            stream=True,
+            timeout=prazo
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                return modelo, delta, stream
+        return modelo, "", stream
+
+    try:
+        modelo, primeiro, stream = executar_com_fallback(
+            MODELOS, _abrir_stream, descartar=lambda resultado: resultado[2].close()
+        )
+    except FalhaNosModelos as exc:
+        _exibir_falhas(exc)
+        yield SEM_MODELO
+        return
+
+    partes = [primeiro]
+    if primeiro:
+        yield primeiro
+    try:
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                partes.append(delta)
+                yield delta
+    except Exception as exc:
+        st.write(f"Falha no modelo {modelo}: {exc}")
+        return
+
+    # Só respostas completas entram no cache
+    answer_cache.guardar(chat_id, mensagem, contexto, "".join(partes))
 
 
 def process_pending_uploads(chat_id: int, user_id: str) -> list[str]:
@@ -78,22 +219,20 @@ def process_pending_uploads(chat_id: int, user_id: str) -> list[str]:
     if not pending_map:
         return []
 
-    processed_paths: list[str] = []
-    for file_id, metadata in list(pending_map.items()):
-        original_name = metadata["original_name"]
-        temp_path = metadata["temp_path"]
-        safe_name = sanitize_filename(original_name)
+    itens = list(pending_map.items())
+    arquivos = []
+    for _, metadata in itens:
+        safe_name = sanitize_filename(metadata["original_name"])
         armazenamento_path = sanitize_storage_path(f"{chat_id}/{safe_name}")
+        arquivos.append((safe_name, armazenamento_path, metadata["temp_path"]))
 
-        try:
-            with open(temp_path, "rb") as temp_file:
-                file_bytes = temp_file.read()
-            salvar_arquivo(chat_id, safe_name, armazenamento_path, file_bytes)
-        except Exception as exc:
-            st.warning(f"Não foi possível enviar {original_name}: {exc}")
+    processed_paths: list[str] = []
+    for (file_id, metadata), erro in zip(itens, salvar_arquivos(chat_id, arquivos, user_id)):
+        if erro is not None:
+            st.warning(f"Não foi possível enviar {metadata['original_name']}: {erro}")
             continue
 
-        processed_paths.append(temp_path)
+        processed_paths.append(metadata["temp_path"])
         del pending_map[file_id]
 
     if pending_map:
@@ -112,6 +251,138 @@ def clear_auth_state():
     st.session_state.pending_delete_chat_title = ""
     st.session_state.pending_uploads = {}
     st.session_state.upload_tokens = {}
+    st.session_state.pending_messages = {}
+    st.session_state.history_cache = {}
+    st.session_state.chats_visiveis = PAGINA_CHATS
+    st.session_state.prefetch_feito = False
+    st.session_state.deleting_chats = {}
+
+
+def registrar_mensagem_pendente(chat_id: int, role: str, content: str, timestamp: str, futuro):
+    """Guarda uma mensagem cuja gravação ainda roda em segundo plano."""
+    st.session_state.pending_messages.setdefault(chat_id, []).append(
+        {"role": role, "content": content, "timestamp": timestamp, "future": futuro}
+    )
+
+
+def mensagens_pendentes(chat_id: int, historico: list[dict]) -> list[dict]:
+    """Mensagens ainda não visíveis no histórico do banco (leitura das próprias escritas).
+
+    A correspondência é pelo instante de criação: uma resposta igual à anterior
+    continua sendo uma mensagem nova. Gravações que falharam (inclusive na fila
+    de escrita, consultada pelo id que salvar_mensagem retornou) continuam
+    visíveis, com opção de tentar de novo.
+    """
+    pendentes = st.session_state.pending_messages.get(chat_id, [])
+    gravadas = {chave_mensagem(msg) for msg in historico}
+
+    restantes = []
+    for item in pendentes:
+        if chave_mensagem(item) in gravadas:
+            continue
+        futuro = item["future"]
+        erro = None
+        if futuro.done():
+            erro = futuro.exception()
+            estado = None if erro is not None else estado_mensagem(futuro.result())
+            if estado is not None and estado["estado"] == "falhou":
+                erro = estado["erro"]
+            elif estado is not None and estado["estado"] == "aguardando_sessao":
+                st.info("A resposta do bot será salva quando a sessão for renovada.")
+        if erro is not None:
+            st.warning(f"Não foi possível salvar a resposta do bot: {erro}")
+            if st.button("Tentar salvar novamente", key=f"retry-save-{chat_id}-{item['timestamp']}"):
+                item["future"] = executar_em_segundo_plano(
+                    salvar_mensagem,
+                    chat_id,
+                    item["role"],
+                    item["content"],
+                    token_atual(),
+                    item["timestamp"],
+                )
+        restantes.append(item)
+
+    if restantes:
+        st.session_state.pending_messages[chat_id] = restantes
+    else:
+        st.session_state.pending_messages.pop(chat_id, None)
+    return restantes
+
+
+def carregar_historico(chat_id: int) -> list[dict]:
+    """Histórico do chat mantido na sessão; cada rerun busca só o que é novo.
+
+    A primeira carga traz a janela mais recente. Depois, a busca parte do último
+    timestamp gravado visto (ou da mensagem mais antiga que ainda estava na fila
+    de escrita, que pode chegar ao banco fora de ordem) e descarta ids repetidos.
+    """
+    cache = st.session_state.history_cache.get(chat_id)
+    if cache is None:
+        linhas = buscar_historico(chat_id, limite=JANELA_HISTORICO)
+        gravadas = [msg for msg in linhas if msg.get("id") is not None]
+        cache = {
+            "mensagens": gravadas,
+            "ids": {msg["id"] for msg in gravadas},
+            "completo": len(gravadas) < JANELA_HISTORICO,
+            "visiveis": JANELA_HISTORICO,
+        }
+        st.session_state.history_cache[chat_id] = cache
+    else:
+        linhas = buscar_historico(chat_id, depois_de=cache.get("cursor"))
+        for msg in linhas:
+            if msg.get("id") is not None and msg["id"] not in cache["ids"]:
+                cache["mensagens"].append(msg)
+                cache["ids"].add(msg["id"])
+
+    na_fila = [msg for msg in linhas if msg.get("id") is None]
+    marcos = [msg["timestamp"] for msg in na_fila if msg.get("timestamp")]
+    if cache["mensagens"]:
+        marcos.append(cache["mensagens"][-1].get("timestamp"))
+    marcos = [marco for marco in marcos if marco]
+    cache["cursor"] = min(marcos) if marcos else None
+
+    return cache["mensagens"] + na_fila
+
+
+def carregar_anteriores(chat_id: int):
+    """Amplia a janela exibida, buscando a página anterior se ainda não estiver na sessão."""
+    cache = st.session_state.history_cache.get(chat_id)
+    if cache is None:
+        return
+    cache["visiveis"] += JANELA_HISTORICO
+    if cache["completo"] or len(cache["mensagens"]) >= cache["visiveis"]:
+        return
+
+    mais_antiga = cache["mensagens"][0].get("timestamp") if cache["mensagens"] else None
+    pagina = buscar_historico(chat_id, antes_de=mais_antiga, limite=JANELA_HISTORICO)
+    novas = [msg for msg in pagina if msg.get("id") is not None and msg["id"] not in cache["ids"]]
+    cache["mensagens"][:0] = novas
+    cache["ids"].update(msg["id"] for msg in novas)
+    cache["completo"] = len(pagina) < JANELA_HISTORICO
+
+
+def listar_chats_paginados(user_id: str, quantidade: int) -> tuple[list[dict], bool]:
+    """Junta páginas de listar_chats até `quantidade`; indica se há mais chats."""
+    chats: list[dict] = []
+    cursor = None
+    while len(chats) < quantidade:
+        pagina = listar_chats(
+            user_id, limite=PAGINA_CHATS, antes_de=cursor, incluir_excluidos=True
+        )
+        # O fim da lista é decidido pela página crua: chats sendo excluídos não a encurtam
+        chats.extend(sem_excluidos(pagina))
+        if len(pagina) < PAGINA_CHATS:
+            return chats, False
+        cursor = pagina[-1].get("created_at")
+    return chats, True
+
+
+def _aplicar_tokens(token: str, refresh: str):
+    """Garante a sessão no cliente e guarda os tokens renovados, se houver renovação."""
+    novo_token, novo_refresh = ensure_session(token, refresh)
+    if (novo_token, novo_refresh) != (token, refresh):
+        st.session_state.auth_token = novo_token
+        st.session_state.auth_refresh_token = novo_refresh
 
 
 def bootstrap_user_session():
@@ -119,25 +390,38 @@ def bootstrap_user_session():
     refresh = st.session_state.auth_refresh_token
     if token and refresh:
         try:
-            set_session(token, refresh)
+            _aplicar_tokens(token, refresh)
         except Exception:
             clear_auth_state()
             return
+        token = st.session_state.auth_token
     if not token or st.session_state.auth_user is not None:
         return
-    try:
-        user = get_current_user(token)
-    except Exception:
-        clear_auth_state()
-        return
+    # Claims de um token válido bastam; o servidor só é consultado se não der para ler
+    user = user_from_token(token)
+    if user is None:
+        try:
+            user = get_current_user(token)
+        except Exception:
+            clear_auth_state()
+            return
     if user:
         st.session_state.auth_user = user
     else:
         clear_auth_state()
 
 
+def token_atual() -> str:
+    """Access token do usuário logado, para gravações feitas fora da thread do Streamlit."""
+    return st.session_state.auth_token
+
+
 def ensure_supabase_session() -> bool:
-    """Força o cliente Supabase a usar os tokens do usuário logado."""
+    """Garante que o cliente Supabase usa os tokens do usuário logado.
+
+    Sem ida ao servidor quando a sessão aplicada já é a do usuário e o token
+    não está perto de expirar.
+    """
     token = st.session_state.get("auth_token")
     refresh = st.session_state.get("auth_refresh_token")
     if not token or not refresh:
@@ -145,7 +429,7 @@ def ensure_supabase_session() -> bool:
         clear_auth_state()
         st.stop()
     try:
-        set_session(token, refresh)
+        _aplicar_tokens(token, refresh)
     except Exception as exc:
         st.warning(f"Não foi possível renovar a sessão: {exc}")
         clear_auth_state()
@@ -169,6 +453,18 @@ if "pending_uploads" not in st.session_state:
 if "upload_tokens" not in st.session_state:
     st.session_state.upload_tokens = {}
 
+if "pending_messages" not in st.session_state:
+    st.session_state.pending_messages = {}
+
+if "history_cache" not in st.session_state:
+    st.session_state.history_cache = {}
+
+if "chats_visiveis" not in st.session_state:
+    st.session_state.chats_visiveis = PAGINA_CHATS
+
+if "deleting_chats" not in st.session_state:
+    st.session_state.deleting_chats = {}
+
 if "auth_user" not in st.session_state:
     st.session_state.auth_user = None
 
@@ -180,6 +476,25 @@ if "auth_refresh_token" not in st.session_state:
 
 bootstrap_user_session()
 
+# Carrega o modelo de embedding em segundo plano assim que há um usuário logado
+if st.session_state.auth_user and os.getenv("RAG_WARMUP", "1") != "0":
+    aquecer_modelo()
+
+# Reindexa os chats mais recentes uma vez por login, antes da primeira pergunta
+if (
+    st.session_state.auth_user
+    and CHATS_PRE_CARREGADOS > 0
+    and not st.session_state.get("prefetch_feito")
+):
+    st.session_state.prefetch_feito = True
+    try:
+        recentes = listar_chats(st.session_state.auth_user.get("id"), limite=PAGINA_CHATS)
+    except Exception:
+        recentes = []
+    ids_recentes = [chat["id"] for chat in recentes[:CHATS_PRE_CARREGADOS] if chat.get("id") is not None]
+    if ids_recentes:
+        pre_carregar_em_segundo_plano(ids_recentes, token_atual())
+
 # Sidebar de autenticação e chats
 with st.sidebar:
     st.header("Conta")
@@ -229,6 +544,9 @@ with st.sidebar:
                                 st.session_state.pending_delete_chat_title = ""
                                 st.session_state.pending_uploads = {}
                                 st.session_state.upload_tokens = {}
+                                st.session_state.history_cache = {}
+                                st.session_state.chats_visiveis = PAGINA_CHATS
+                                st.session_state.prefetch_feito = False
                                 st.success("Login realizado!")
                                 st.rerun()
         with signup_tab:
@@ -257,10 +575,10 @@ with st.sidebar:
         user_id = current_user.get("id")
         ensure_supabase_session()
         try:
-            chats = listar_chats(user_id)
+            chats, ha_mais_chats = listar_chats_paginados(user_id, st.session_state.chats_visiveis)
         except Exception as exc:
             st.error(f"Não foi possível listar os chats: {exc}")
-            chats = []
+            chats, ha_mais_chats = [], False
 
         chat_ids = {chat.get("id") for chat in chats if chat.get("id") is not None}
         if st.session_state.chat_id and st.session_state.chat_id not in chat_ids:
@@ -286,6 +604,10 @@ with st.sidebar:
                     st.session_state.pending_delete_chat_title = label
                     st.rerun()
 
+        if ha_mais_chats and st.button("Mostrar mais chats", key="more-chats"):
+            st.session_state.chats_visiveis += PAGINA_CHATS
+            st.rerun()
+
         if st.button("➕ Novo chat"):
             titulo = "Novo chat"
             ensure_supabase_session()
@@ -299,6 +621,16 @@ with st.sidebar:
                 st.session_state.chat_id = novo_chat_id
                 st.rerun()
 
+        for excluido_id, titulo in list(st.session_state.deleting_chats.items()):
+            status = status_exclusao(excluido_id)
+            if status is None or status["estado"] == "concluida":
+                st.session_state.deleting_chats.pop(excluido_id, None)
+            elif status["estado"] == "falhou":
+                st.error(f"Não foi possível remover '{titulo}': {status['erro']}")
+                st.session_state.deleting_chats.pop(excluido_id, None)
+            else:
+                st.caption(f"Excluindo '{titulo}'...")
+
         pending_delete = st.session_state.pending_delete_chat_id
         if pending_delete:
             st.warning(f"Deseja apagar '{st.session_state.pending_delete_chat_title}'? Esta ação é permanente.")
@@ -307,7 +639,11 @@ with st.sidebar:
                 if st.button("Confirmar exclusão", key="confirm-delete"):
                     ensure_supabase_session()
                     try:
-                        deletar_chat(pending_delete)
+                        deletar_chat(
+                            pending_delete,
+                            access_token=token_atual(),
+                            ao_concluir=limpar_chat_contexto,
+                        )
                     except Exception as exc:
                         st.error(f"Não foi possível remover o chat: {exc}")
                     else:
@@ -315,7 +651,10 @@ with st.sidebar:
                             st.session_state.chat_id = None
                         st.session_state.pending_uploads.pop(pending_delete, None)
                         st.session_state.upload_tokens.pop(pending_delete, None)
-                        limpar_chat_contexto(pending_delete)
+                        st.session_state.history_cache.pop(pending_delete, None)
+                        st.session_state.deleting_chats[pending_delete] = (
+                            st.session_state.pending_delete_chat_title
+                        )
                         st.session_state.pending_delete_chat_id = None
                         st.session_state.pending_delete_chat_title = ""
                         st.rerun()
@@ -382,15 +721,27 @@ st.divider()
 # Histórico do chat atual
 ensure_supabase_session()
 try:
-    historico = buscar_historico(chat_id)
+    historico = carregar_historico(chat_id)
 except Exception as exc:
     st.error(f"Não foi possível buscar o histórico: {exc}")
     historico = []
 
-if not historico:
+pendentes = mensagens_pendentes(chat_id, historico)
+
+if not historico and not pendentes:
     st.caption("Nenhuma mensagem ainda. Envie algo para começar!")
 
-for msg in historico:
+cache_historico = st.session_state.history_cache.get(chat_id)
+visiveis = cache_historico["visiveis"] if cache_historico else len(historico)
+if cache_historico and (len(historico) > visiveis or not cache_historico["completo"]):
+    if st.button("⬆️ Carregar mensagens anteriores", key=f"older-{chat_id}"):
+        try:
+            carregar_anteriores(chat_id)
+        except Exception as exc:
+            st.error(f"Não foi possível carregar mensagens anteriores: {exc}")
+        st.rerun()
+
+for msg in historico[-visiveis:] + pendentes:
     role = msg.get("role", "assistant")
     content = msg.get("content", "")
     with st.chat_message(role):
@@ -399,6 +750,12 @@ for msg in historico:
 user_msg = st.chat_input("Digite sua mensagem...")
 
 if user_msg:
+    if st.session_state.pending_uploads.get(chat_id):
+        # Num worker novo, os arquivos antigos entram no índice antes dos recém-enviados
+        try:
+            reidratar_chat(chat_id, token_atual())
+        except Exception as exc:
+            st.warning(f"Não foi possível recuperar os arquivos anteriores do chat: {exc}")
     staged_paths = process_pending_uploads(chat_id, user_id)
     if staged_paths:
         try:
@@ -415,31 +772,53 @@ if user_msg:
                 except OSError:
                     pass
 
-    primeira_mensagem = not historico
-    try:
-        ensure_supabase_session()
-        salvar_mensagem(chat_id, "user", user_msg)
-    except Exception as exc:
-        st.warning(f"Não foi possível salvar a mensagem do usuário: {exc}")
+    primeira_mensagem = not historico and not pendentes
 
+    # Gravações rodam em paralelo com a busca e a geração da resposta
+    ensure_supabase_session()
+    gravacoes = [(
+        executar_em_segundo_plano(salvar_mensagem, chat_id, "user", user_msg, token_atual()),
+        "Não foi possível salvar a mensagem do usuário",
+    )]
     if primeira_mensagem:
         novo_titulo = generate_chat_title(user_msg)
+        gravacoes.append((
+            executar_em_segundo_plano(atualizar_titulo_chat, chat_id, novo_titulo, token_atual()),
+            "Não foi possível atualizar o título do chat",
+        ))
+
+    with st.chat_message("user"):
+        st.write(user_msg)
+
+    with st.chat_message("assistant"):
         try:
-            ensure_supabase_session()
-            atualizar_titulo_chat(chat_id, novo_titulo)
+            if STREAM_RESPOSTAS:
+                resposta = st.write_stream(gerar_resposta_stream(chat_id, user_msg))
+                if not isinstance(resposta, str):
+                    resposta = "".join(str(parte) for parte in resposta)
+            else:
+                resposta = gerar_resposta(chat_id, user_msg)
+                st.write(resposta)
         except Exception as exc:
-            st.warning(f"Não foi possível atualizar o título do chat: {exc}")
-
-    try:
-        resposta = gerar_resposta(chat_id, user_msg)
-    except Exception as exc:
-        st.error(f"Erro ao gerar resposta: {exc}")
-        resposta = "Não foi possível gerar uma resposta no momento."
+            st.error(f"Erro ao gerar resposta: {exc}")
+            resposta = "Não foi possível gerar uma resposta no momento."
 
-    try:
-        ensure_supabase_session()
-        salvar_mensagem(chat_id, "assistant", resposta)
-    except Exception as exc:
-        st.warning(f"Não foi possível salvar a resposta do bot: {exc}")
+    for futuro, aviso in gravacoes:
+        try:
+            futuro.result()
+        except Exception as exc:
+            st.warning(f"{aviso}: {exc}")
+
+    # A resposta é gravada depois do rerun; até lá aparece a partir da sessão
+    instante = datetime.datetime.utcnow().isoformat()
+    registrar_mensagem_pendente(
+        chat_id,
+        "assistant",
+        resposta,
+        instante,
+        executar_em_segundo_plano(
+            salvar_mensagem, chat_id, "assistant", resposta, token_atual(), instante
+        ),
+    )
 
     st.rerun()
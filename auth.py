@@ -1,9 +1,28 @@
 """Helpers para autenticação com Supabase."""
 
-from typing import Any, Dict, Optional
+import base64
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
 
 from supabase_client import supabase
 
+# Renova o access token quando faltar menos que isso (s) para expirar
+REFRESH_MARGIN_S = float(os.getenv("AUTH_REFRESH_MARGIN_S", "60"))
+
+# O cliente é global: guarda o par de tokens aplicado para não reaplicá-lo à toa
+_applied: Optional[Tuple[str, str]] = None
+# refresh token já usado -> par renovado (a renovação acontece uma vez por token)
+_refreshed: Dict[str, Tuple[str, str]] = {}
+# access token antigo -> access token que o substituiu
+_renewed_access: Dict[str, str] = {}
+# id do usuário (claim sub) -> access token mais recente visto neste processo
+_latest_by_user: Dict[str, str] = {}
+_MAX_REFRESHED = 256
+_session_lock = threading.RLock()
+
 
 def _user_to_dict(user: Any) -> Optional[Dict[str, Any]]:
     if user is None:
@@ -23,11 +42,16 @@ def sign_up(email: str, password: str) -> Optional[Dict[str, Any]]:
 
 
 def sign_in(email: str, password: str):
+    global _applied
     response = supabase.auth.sign_in_with_password({"email": email, "password": password})
     user = _user_to_dict(getattr(response, "user", None))
     session = getattr(response, "session", None)
     access_token = getattr(session, "access_token", None)
     refresh_token = getattr(session, "refresh_token", None)
+    # O login já deixa a sessão aplicada no cliente
+    with _session_lock:
+        _applied = (access_token, refresh_token) if access_token and refresh_token else None
+    _remember_token(access_token)
     return {
         "user": user,
         "access_token": access_token,
@@ -36,6 +60,9 @@ def sign_in(email: str, password: str):
 
 
 def sign_out():
+    global _applied
+    with _session_lock:
+        _applied = None
     return supabase.auth.sign_out()
 
 
@@ -48,7 +75,121 @@ def get_current_user(access_token: Optional[str] = None) -> Optional[Dict[str, A
     return _user_to_dict(user)
 
 
+def token_claims(access_token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Payload do JWT, sem validar a assinatura (a validação fica com o Supabase)."""
+    try:
+        payload = access_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except (AttributeError, IndexError, ValueError):
+        return None
+    return claims if isinstance(claims, dict) else None
+
+
+def token_expires_in(access_token: Optional[str]) -> Optional[float]:
+    """Segundos até o access token expirar (negativo se já expirou; None se ilegível)."""
+    claims = token_claims(access_token)
+    if not claims or claims.get("exp") is None:
+        return None
+    try:
+        return float(claims["exp"]) - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def user_from_token(access_token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Usuário montado das claims de um token ainda válido, sem ida ao servidor."""
+    claims = token_claims(access_token)
+    restante = token_expires_in(access_token)
+    if not claims or not claims.get("sub") or restante is None or restante <= 0:
+        return None
+    return {"id": claims["sub"], "email": claims.get("email"), "role": claims.get("role")}
+
+
+def _remember_token(access_token: Optional[str]):
+    # Guarda o token que vale por mais tempo de cada usuário
+    sub = (token_claims(access_token) or {}).get("sub")
+    if not sub:
+        return
+    with _session_lock:
+        atual = _latest_by_user.get(sub)
+        if atual is not None and (token_expires_in(atual) or 0) > (token_expires_in(access_token) or 0):
+            return
+        _latest_by_user.pop(sub, None)
+        if len(_latest_by_user) >= _MAX_REFRESHED:
+            _latest_by_user.pop(next(iter(_latest_by_user)))
+        _latest_by_user[sub] = access_token
+
+
 def set_session(access_token: Optional[str], refresh_token: Optional[str]):
+    global _applied
     if not access_token or not refresh_token:
         return
-    supabase.auth.set_session(access_token, refresh_token)
+    with _session_lock:
+        # Gravações em segundo plano podem trazer um par que já foi renovado
+        for _ in range(_MAX_REFRESHED):
+            if refresh_token not in _refreshed:
+                break
+            access_token, refresh_token = _refreshed[refresh_token]
+        _remember_token(access_token)
+        if _applied == (access_token, refresh_token):
+            return
+        supabase.auth.set_session(access_token, refresh_token)
+        _applied = (access_token, refresh_token)
+
+
+def current_access_token(access_token: Optional[str]) -> Optional[str]:
+    """Access token mais recente da mesma sessão, seguindo renovações já feitas.
+
+    Se o resultado já expirou (ex.: token de um journal lido após um reinício),
+    usa o token mais recente do mesmo usuário visto neste processo, se houver
+    um que ainda vale.
+    """
+    with _session_lock:
+        for _ in range(_MAX_REFRESHED):
+            novo = _renewed_access.get(access_token)
+            if novo is None:
+                break
+            access_token = novo
+        restante = token_expires_in(access_token)
+        if restante is not None and restante <= 0:
+            sub = (token_claims(access_token) or {}).get("sub")
+            recente = _latest_by_user.get(sub) if sub else None
+            if recente is not None and (token_expires_in(recente) or 0) > 0:
+                access_token = recente
+    return access_token
+
+
+def ensure_session(access_token: str, refresh_token: str) -> Tuple[str, str]:
+    """Aplica a sessão só se ela mudou e renova os tokens perto da expiração.
+
+    Retorna o par de tokens em uso, que difere do recebido após uma renovação.
+    A renovação usa cada refresh token uma única vez; chamadas posteriores com o
+    mesmo par recebem o resultado já obtido.
+    """
+    global _applied
+    restante = token_expires_in(access_token)
+    if restante is None or restante > REFRESH_MARGIN_S:
+        set_session(access_token, refresh_token)
+        return access_token, refresh_token
+
+    with _session_lock:
+        renovado = _refreshed.get(refresh_token)
+        if renovado is None:
+            response = supabase.auth.refresh_session(refresh_token)
+            session = getattr(response, "session", None)
+            novo_access = getattr(session, "access_token", None)
+            novo_refresh = getattr(session, "refresh_token", None)
+            if not novo_access or not novo_refresh:
+                raise RuntimeError("Não foi possível renovar a sessão.")
+            renovado = (novo_access, novo_refresh)
+            if len(_refreshed) >= _MAX_REFRESHED:
+                _refreshed.pop(next(iter(_refreshed)))
+            _refreshed[refresh_token] = renovado
+            if len(_renewed_access) >= _MAX_REFRESHED:
+                _renewed_access.pop(next(iter(_renewed_access)))
+            _renewed_access[access_token] = renovado[0]
+            # refresh_session já deixa a nova sessão aplicada no cliente
+            _applied = renovado
+        set_session(*renovado)
+    return renovado
@@ -0,0 +1,40 @@
+"""Execução de tarefas de persistência fora do caminho crítico, com novas tentativas."""
+
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BACKGROUND_WORKERS", "4")),
+    thread_name_prefix="persist",
+)
+
+
+def _com_tentativas(fn: Callable[..., Any], tentativas: int, espera: float, *args, **kwargs):
+    for tentativa in range(1, tentativas + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as exc:
+            if tentativa == tentativas:
+                logger.warning("%s falhou após %d tentativas: %s", fn.__name__, tentativas, exc)
+                raise
+            # Backoff exponencial: espera, 2·espera, 4·espera...
+            time.sleep(espera * (2 ** (tentativa - 1)))
+
+
+def executar_em_segundo_plano(
+    fn: Callable[..., Any],
+    *args,
+    tentativas: int = 3,
+    espera: float = 0.5,
+    **kwargs,
+) -> Future:
+    """Agenda `fn(*args, **kwargs)` numa thread, repetindo em caso de erro."""
+    return _executor.submit(_com_tentativas, fn, tentativas, espera, *args, **kwargs)
+
+
+__all__ = ["executar_em_segundo_plano"]
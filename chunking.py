@@ -0,0 +1,133 @@
+"""Divisão de texto em janelas com orçamento de tokens e sobreposição."""
+
+import os
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Aproximação barata dos tokens do MiniLM: palavras e pontuações isoladas
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_FRASE_RE = re.compile(r"(?<=[.!?;:])\s+")
+
+# O MiniLM trunca em 256 wordpieces e palavras em português costumam virar 1,5-2
+# wordpieces: 128 tokens da estimativa acima cabem inteiros no modelo
+MAX_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "128"))
+SOBREPOSICAO = int(os.getenv("RAG_CHUNK_OVERLAP", "24"))
+
+# (texto, tokens, inicia_paragrafo)
+_Unidade = Tuple[str, int, bool]
+
+
+def contar_tokens(texto: str) -> int:
+    """Estimativa de tokens usada para dimensionar chunks e prompts."""
+    return len(_TOKEN_RE.findall(texto))
+
+
+def _janelas_de_palavras(
+    frase: str, max_tokens: int, sobreposicao: int
+) -> Iterator[Tuple[str, int]]:
+    palavras: List[Tuple[str, int]] = []
+    total = 0
+    for palavra in frase.split():
+        n = contar_tokens(palavra)
+        if palavras and total + n > max_tokens:
+            yield " ".join(p for p, _ in palavras), total
+            while palavras and (total > sobreposicao or total + n > max_tokens):
+                total -= palavras.pop(0)[1]
+        palavras.append((palavra, n))
+        total += n
+    if palavras:
+        yield " ".join(p for p, _ in palavras), total
+
+
+def _unidades(paragrafo: str, max_tokens: int, sobreposicao: int) -> Iterator[_Unidade]:
+    """Quebra o parágrafo em frases (e frases longas em palavras) só quando necessário."""
+    n = contar_tokens(paragrafo)
+    if n <= max_tokens:
+        yield paragrafo, n, True
+        return
+
+    inicio = True
+    for frase in _FRASE_RE.split(paragrafo):
+        if not frase:
+            continue
+        n = contar_tokens(frase)
+        if n <= max_tokens:
+            yield frase, n, inicio
+            inicio = False
+            continue
+        for janela, n_janela in _janelas_de_palavras(frase, max_tokens, sobreposicao):
+            yield janela, n_janela, inicio
+            inicio = False
+
+
+def _juntar(janela: List[_Unidade]) -> str:
+    partes: List[str] = []
+    for texto, _, novo_paragrafo in janela:
+        if partes:
+            partes.append("\n" if novo_paragrafo else " ")
+        partes.append(texto)
+    return "".join(partes)
+
+
+def fatiar(
+    paragrafos: Iterable[Optional[str]],
+    max_tokens: int = MAX_TOKENS,
+    sobreposicao: int = SOBREPOSICAO,
+) -> Iterator[str]:
+    """Agrupa parágrafos em chunks de até `max_tokens`, repetindo o final do anterior.
+
+    `None` em `paragrafos` marca uma fronteira rígida (ex.: fim de página): o chunk
+    atual é encerrado ali e não há sobreposição com o próximo.
+    """
+    # Validado já na chamada, e não no primeiro next() do gerador
+    if max_tokens <= 0:
+        raise ValueError(f"max_tokens deve ser positivo (recebido {max_tokens})")
+    if not 0 <= sobreposicao < max_tokens:
+        raise ValueError(
+            f"sobreposicao deve estar entre 0 e max_tokens - 1 "
+            f"(recebido {sobreposicao} com max_tokens={max_tokens})"
+        )
+    return _fatiar(paragrafos, max_tokens, sobreposicao)
+
+
+def _fatiar(
+    paragrafos: Iterable[Optional[str]], max_tokens: int, sobreposicao: int
+) -> Iterator[str]:
+    janela: List[_Unidade] = []
+    total = 0
+
+    for paragrafo in paragrafos:
+        if paragrafo is None:
+            if janela:
+                yield _juntar(janela)
+            janela, total = [], 0
+            continue
+
+        paragrafo = paragrafo.strip()
+        if not paragrafo:
+            continue
+
+        for unidade in _unidades(paragrafo, max_tokens, sobreposicao):
+            n = unidade[1]
+            if janela and total + n > max_tokens:
+                yield _juntar(janela)
+
+                cauda: List[_Unidade] = []
+                tokens_cauda = 0
+                for anterior in reversed(janela):
+                    if tokens_cauda + anterior[1] > sobreposicao:
+                        break
+                    cauda.insert(0, anterior)
+                    tokens_cauda += anterior[1]
+                if tokens_cauda + n > max_tokens:
+                    cauda, tokens_cauda = [], 0
+                janela, total = cauda, tokens_cauda
+
+            janela.append(unidade)
+            total += n
+
+    if janela:
+        yield _juntar(janela)
+
+
+__all__ = ["MAX_TOKENS", "SOBREPOSICAO", "contar_tokens", "fatiar"]
@@ -0,0 +1,76 @@
+"""Montagem do contexto do prompt dentro de um orçamento de tokens."""
+
+import os
+import re
+from typing import List, Set
+
+from chunking import contar_tokens
+
+ORCAMENTO_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1200"))
+# Trechos com Jaccard (trigramas de palavras) acima disso são considerados repetidos
+LIMIAR_DUPLICATA = float(os.getenv("RAG_CONTEXT_DEDUP", "0.8"))
+# Sobra mínima para valer a pena incluir um trecho cortado
+_MIN_TOKENS_CORTE = 20
+
+_FRASE_RE = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def _trigramas(texto: str) -> Set[tuple]:
+    palavras = texto.lower().split()
+    if len(palavras) < 3:
+        return {tuple(palavras)}
+    return {tuple(palavras[i:i + 3]) for i in range(len(palavras) - 2)}
+
+
+def _similar(a: Set[tuple], b: Set[tuple]) -> bool:
+    if not a or not b:
+        return False
+    return len(a & b) / len(a | b) >= LIMIAR_DUPLICATA
+
+
+def _cortar(trecho: str, limite: int) -> str:
+    """Mantém as frases iniciais do trecho que cabem em `limite` tokens."""
+    frases: List[str] = []
+    usados = 0
+    for frase in _FRASE_RE.split(trecho):
+        n = contar_tokens(frase)
+        if usados + n > limite:
+            break
+        frases.append(frase)
+        usados += n
+    return " ".join(frases)
+
+
+def empacotar(trechos: List[str], orcamento: int = ORCAMENTO_TOKENS) -> List[str]:
+    """Seleciona trechos na ordem de relevância recebida até esgotar o orçamento.
+
+    Quase-duplicatas de um trecho já escolhido são descartadas e o trecho que
+    não cabe inteiro é cortado no fim de uma frase.
+    """
+    escolhidos: List[str] = []
+    vistos: List[Set[tuple]] = []
+    restante = orcamento
+
+    for trecho in trechos:
+        if restante < _MIN_TOKENS_CORTE:
+            break
+
+        trigramas = _trigramas(trecho)
+        if any(_similar(trigramas, anterior) for anterior in vistos):
+            continue
+
+        n = contar_tokens(trecho)
+        if n > restante:
+            trecho = _cortar(trecho, restante)
+            n = contar_tokens(trecho)
+            if n < _MIN_TOKENS_CORTE:
+                continue
+
+        escolhidos.append(trecho)
+        vistos.append(trigramas)
+        restante -= n
+
+    return escolhidos
+
+
+__all__ = ["ORCAMENTO_TOKENS", "empacotar"]
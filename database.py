@@ -1,23 +1,123 @@
 """Funções utilitárias para trabalhar com Supabase (chats, mensagens e arquivos)."""
 
 import datetime
-from typing import Any, Dict, List, Optional
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
-from supabase_client import supabase
+from supabase_client import client_for_token, supabase
+from auth import current_access_token, token_expires_in
+from background_tasks import executar_em_segundo_plano
 from filename_utils import sanitize_filename, sanitize_storage_path
+from write_behind import SessaoExpirada, WriteBehindQueue
 
+# Inserts de mensagens agrupados em lotes (MESSAGES_WRITE_BEHIND=0 grava na hora)
+_WRITE_BEHIND = os.getenv("MESSAGES_WRITE_BEHIND", "1") != "0"
 
-def listar_chats(user_id: str) -> List[Dict[str, Any]]:
-    """Retorna todos os chats do usuário ordenados do mais recente para o mais antigo."""
-    response = (
+
+def _cliente(access_token: Optional[str]):
+    """Cliente que age em nome do dono do token (segue renovações); sem token, o global."""
+    return client_for_token(current_access_token(access_token))
+
+
+def _inserir_mensagens(payloads: List[Dict[str, Any]], access_token: Optional[str]):
+    token = current_access_token(access_token)
+    restante = token_expires_in(token)
+    if restante is not None and restante <= 0:
+        # Ex.: journal reenviado após um reinício, antes de o usuário entrar de novo
+        raise SessaoExpirada("Sessão expirada; a mensagem será enviada após um novo login.")
+    return client_for_token(token).table("messages").insert(payloads).execute()
+
+
+_fila_mensagens: Optional[WriteBehindQueue] = None
+if _WRITE_BEHIND:
+    _fila_mensagens = WriteBehindQueue(
+        _inserir_mensagens,
+        os.getenv("MESSAGES_JOURNAL_DIR", ".write_behind"),
+        "messages",
+        max_lote=int(os.getenv("MESSAGES_BATCH_SIZE", "50")),
+        intervalo=float(os.getenv("MESSAGES_FLUSH_S", "0.5")),
+    )
+
+
+# Páginas de listar_chats por usuário: {user_id: {(antes_de, limite): (criado_em, chats)}}
+_CHATS_CACHE_TTL = float(os.getenv("CHATS_CACHE_TTL_S", "300"))
+_cache_chats: Dict[str, Dict[tuple, tuple]] = {}
+_cache_chats_lock = threading.Lock()
+
+
+def _invalidar_chats(user_id: Optional[str] = None):
+    with _cache_chats_lock:
+        if user_id is None:
+            _cache_chats.clear()
+        else:
+            _cache_chats.pop(user_id, None)
+
+
+def _atualizar_chat_em_cache(chat_id: int, alteracao: Optional[Dict[str, Any]]):
+    """Aplica `alteracao` ao chat nas páginas em cache.
+
+    Com `alteracao` None (chat removido) as páginas do dono são descartadas, já
+    que o deslocamento mudaria os cursores das páginas seguintes.
+    """
+    with _cache_chats_lock:
+        for user_id, paginas in list(_cache_chats.items()):
+            for chave, (criado_em, chats) in list(paginas.items()):
+                if not any(chat.get("id") == chat_id for chat in chats):
+                    continue
+                if alteracao is None:
+                    _cache_chats.pop(user_id, None)
+                    break
+                paginas[chave] = (criado_em, [
+                    {**chat, **alteracao} if chat.get("id") == chat_id else chat
+                    for chat in chats
+                ])
+
+
+def listar_chats(
+    user_id: str,
+    limite: Optional[int] = None,
+    antes_de: Optional[str] = None,
+    incluir_excluidos: bool = False,
+) -> List[Dict[str, Any]]:
+    """Retorna os chats do usuário ordenados do mais recente para o mais antigo.
+
+    Com `limite`, devolve uma página; a seguinte começa em `antes_de` igual ao
+    created_at do último chat recebido. Páginas ficam em cache por usuário até
+    criar_chat, deletar_chat ou atualizar_titulo_chat as invalidarem (ou o TTL
+    vencer, para refletir mudanças feitas em outra sessão).
+
+    Chats com exclusão em andamento são omitidos. Para paginar, use
+    `incluir_excluidos=True` e filtre com sem_excluidos() depois: a página
+    filtrada pode vir menor que `limite` sem ser a última.
+    """
+    chave = (antes_de, limite)
+    with _cache_chats_lock:
+        em_cache = _cache_chats.get(user_id, {}).get(chave)
+    if em_cache is not None and time.monotonic() - em_cache[0] < _CHATS_CACHE_TTL:
+        chats = em_cache[1]
+        return chats if incluir_excluidos else sem_excluidos(chats)
+
+    query = (
         supabase
         .table("chats")
         .select("id,title,created_at")
         .eq("user_id", user_id)
-        .order("created_at", desc=True)
-        .execute()
     )
-    return response.data or []
+    if antes_de is not None:
+        query = query.lt("created_at", antes_de)
+    query = query.order("created_at", desc=True)
+    if limite is not None:
+        query = query.limit(limite)
+    chats = query.execute().data or []
+
+    with _cache_chats_lock:
+        _cache_chats.setdefault(user_id, {})[chave] = (time.monotonic(), chats)
+    return chats if incluir_excluidos else sem_excluidos(chats)
 
 
 def criar_chat(title: str, user_id: str) -> Optional[int]:
@@ -28,63 +128,351 @@ def criar_chat(title: str, user_id: str) -> Optional[int]:
         "created_at": datetime.datetime.utcnow().isoformat(),
     }
     response = supabase.table("chats").insert(payload).execute()
+    _invalidar_chats(user_id)
     data = response.data or []
     if data:
         return data[0].get("id")
     return None
 
 
-def salvar_mensagem(chat_id: int, role: str, content: str):
-    """Salva mensagem vinculando o chat ao campo chat_id."""
+_FRACAO_RE = re.compile(r"^(.*T\d{2}:\d{2}:\d{2})(?:\.(\d+))?(.*)$")
+
+
+def normalizar_timestamp(valor: Any) -> Optional[str]:
+    """Forma canônica (UTC, microssegundos) de um timestamp do banco ou gerado localmente.
+
+    O Postgres devolve o instante gravado com fuso e sem zeros à direita; o
+    cliente gera ISO sem fuso. Ambos viram a mesma string.
+    """
+    if not valor:
+        return None
+    texto = str(valor).strip().replace(" ", "T").replace("Z", "+00:00")
+    partes = _FRACAO_RE.match(texto)
+    if partes:
+        base, fracao, resto = partes.groups()
+        texto = f"{base}.{(fracao or '0')[:6].ljust(6, '0')}{resto}"
+    try:
+        instante = datetime.datetime.fromisoformat(texto)
+    except ValueError:
+        return str(valor)
+    if instante.tzinfo is not None:
+        instante = instante.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return instante.isoformat(timespec="microseconds")
+
+
+def chave_mensagem(mensagem: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Identifica uma mensagem por papel e instante de criação (gerado no cliente)."""
+    return mensagem.get("role"), normalizar_timestamp(mensagem.get("timestamp"))
+
+
+def salvar_mensagem(
+    chat_id: int,
+    role: str,
+    content: str,
+    access_token: Optional[str] = None,
+    timestamp: Optional[str] = None,
+):
+    """Salva mensagem vinculando o chat ao campo chat_id.
+
+    Com write-behind ativo, a mensagem vai para o journal local e é inserida no
+    próximo lote, em nome do dono de `access_token` (só o access token é gravado
+    no journal). `timestamp` permite ao chamador reconhecer a mensagem depois
+    (ver chave_mensagem); por padrão, o instante atual.
+    """
     payload = {
         "chat_id": chat_id,
         "role": role,
         "content": content,
-        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "timestamp": timestamp or datetime.datetime.utcnow().isoformat(),
     }
-    return supabase.table("messages").insert(payload).execute()
+    if _fila_mensagens is not None:
+        return _fila_mensagens.enfileirar(payload, access_token)
+    return _cliente(access_token).table("messages").insert(payload).execute()
 
 
-def buscar_historico(chat_id: int) -> List[Dict[str, Any]]:
-    """Busca histórico filtrando por chat_id."""
-    response = (
+def flush_mensagens():
+    """Força o envio imediato das mensagens enfileiradas."""
+    if _fila_mensagens is not None:
+        _fila_mensagens.flush()
+
+
+def estado_mensagem(item_id: Any) -> Optional[Dict[str, Any]]:
+    """Situação de uma mensagem enfileirada pelo id que salvar_mensagem retornou.
+
+    None se ela já foi gravada (ou não passou pela fila); ver WriteBehindQueue.estado.
+    """
+    if _fila_mensagens is None or not isinstance(item_id, str):
+        return None
+    return _fila_mensagens.estado(item_id)
+
+
+def buscar_historico(
+    chat_id: int,
+    depois_de: Optional[str] = None,
+    antes_de: Optional[str] = None,
+    limite: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Busca histórico filtrando por chat_id, em ordem cronológica.
+
+    Paginação por chave (timestamp): `depois_de` traz mensagens a partir desse
+    instante (inclusive) e `antes_de` as anteriores a ele; com `limite`, vêm as
+    mais recentes da faixa. Mensagens ainda na fila de escrita (sem "id") são
+    acrescentadas ao fim, exceto em páginas antigas (`antes_de`).
+    """
+    pendentes = []
+    if _fila_mensagens is not None and antes_de is None:
+        # Lidas antes do select: se o lote for enviado no meio, a duplicata é filtrada abaixo
+        pendentes = _fila_mensagens.pendentes(lambda payload: payload.get("chat_id") == chat_id)
+
+    query = (
         supabase
         .table("messages")
         .select("*")
         .eq("chat_id", chat_id)
-        .order("timestamp", desc=False)
-        .execute()
     )
-    return response.data or []
+    if depois_de is not None:
+        query = query.gte("timestamp", depois_de)
+    if antes_de is not None:
+        query = query.lt("timestamp", antes_de)
 
+    if limite is not None:
+        response = query.order("timestamp", desc=True).limit(limite).execute()
+        mensagens = list(reversed(response.data or []))
+    else:
+        response = query.order("timestamp", desc=False).execute()
+        mensagens = response.data or []
+
+    if not pendentes:
+        return mensagens
+
+    # Pelo instante de criação, não pelo conteúdo: respostas repetidas são legítimas
+    gravadas = {chave_mensagem(msg) for msg in mensagens}
+    mensagens.extend(
+        payload for payload in pendentes
+        if chave_mensagem(payload) not in gravadas
+    )
+    return mensagens
 
-def salvar_arquivo(chat_id: int, nome: str, caminho: str, dados_bytes: bytes):
-    """Faz upload para o Storage e armazena metadados na tabela files."""
-    safe_name = sanitize_filename(nome)
-    safe_path = sanitize_storage_path(caminho or safe_name)
 
+# Uploads simultâneos em salvar_arquivos
+_UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+_executor_uploads = ThreadPoolExecutor(max_workers=_UPLOAD_WORKERS, thread_name_prefix="upload")
+
+# Armazenamento endereçado por conteúdo (STORAGE_DEDUP=0 volta a usar o caminho recebido)
+_DEDUP = os.getenv("STORAGE_DEDUP", "1") != "0"
+_PREFIXO_CONTEUDO = "blobs"
+_BLOCO_HASH = 1024 * 1024
+
+
+def _enviar_para_storage(safe_path: str, dados: Union[bytes, BinaryIO]):
     result = supabase.storage.from_("uploads").upload(
         safe_path,
-        dados_bytes,
+        dados,
         {"content-type": "application/octet-stream"}
     )
 
     if isinstance(result, dict) and result.get("error"):
         raise RuntimeError(f"Erro ao enviar arquivo: {result['error']}")
 
-    payload = {
+
+def _hash_conteudo(dados: Union[bytes, BinaryIO]) -> str:
+    if isinstance(dados, bytes):
+        return hashlib.sha256(dados).hexdigest()
+    digest = hashlib.sha256()
+    for bloco in iter(lambda: dados.read(_BLOCO_HASH), b""):
+        digest.update(bloco)
+    dados.seek(0)
+    return digest.hexdigest()
+
+
+def _caminho_conteudo(digest: str, user_id: str) -> str:
+    # Por usuário: a contagem de referências só enxerga as linhas de files que o RLS libera
+    return sanitize_storage_path("/".join([_PREFIXO_CONTEUDO, str(user_id), digest[:2], digest]))
+
+
+def _caminhos_referenciados(
+    caminhos: Sequence[str],
+    cliente=None,
+    exceto_chat: Optional[int] = None,
+) -> set:
+    """Caminhos do Storage apontados por alguma linha de files (fora de `exceto_chat`)."""
+    if not caminhos:
+        return set()
+    query = (
+        (cliente or supabase)
+        .table("files")
+        .select("path")
+        .in_("path", list(caminhos))
+    )
+    if exceto_chat is not None:
+        query = query.neq("chat_id", exceto_chat)
+    response = query.execute()
+    return {item.get("path") for item in response.data or []}
+
+
+def _objeto_ja_existe(exc: BaseException) -> bool:
+    # StorageApiError (storage3) traz o status HTTP em .status e o código em .code
+    return str(getattr(exc, "status", "")) == "409" or getattr(exc, "code", None) == "Duplicate"
+
+
+def _armazenar(
+    safe_path: str,
+    dados: Union[bytes, BinaryIO],
+    user_id: Optional[str] = None,
+) -> Tuple[str, bool]:
+    """Envia o conteúdo e retorna (caminho no Storage, se um objeto novo foi criado).
+
+    Com deduplicação, o caminho deriva do SHA-256 do conteúdo: se alguma linha
+    de files já aponta para ele, o upload é pulado e só os metadados são gravados.
+    Sem `user_id` não há deduplicação: um endereço comum a todas as contas
+    misturaria objetos de usuários diferentes.
+    """
+    if not _DEDUP or not user_id:
+        _enviar_para_storage(safe_path, dados)
+        return safe_path, True
+
+    destino = _caminho_conteudo(_hash_conteudo(dados), user_id)
+    if _caminhos_referenciados([destino]):
+        return destino, False
+    try:
+        _enviar_para_storage(destino, dados)
+    except Exception as exc:
+        # Outro upload do mesmo conteúdo chegou primeiro
+        if _objeto_ja_existe(exc):
+            return destino, False
+        raise
+    return destino, True
+
+
+def _restaurar_se_removido(destino: str, dados: Union[bytes, BinaryIO]):
+    """Reenvia o conteúdo se o objeto sumiu depois da checagem de referências.
+
+    A exclusão de outro chat do mesmo usuário pode ter visto o objeto como órfão
+    antes de a nova linha de files existir; checado depois do insert, o objeto
+    removido nesse intervalo é recriado.
+    """
+    if supabase.storage.from_("uploads").exists(destino):
+        return
+    try:
+        _enviar_para_storage(destino, dados)
+    except Exception as exc:
+        if not _objeto_ja_existe(exc):
+            raise
+
+
+def _restaurar_arquivo_local(destino: str, origem: str):
+    with open(origem, "rb") as arquivo:
+        _restaurar_se_removido(destino, arquivo)
+
+
+def _armazenar_arquivo_local(safe_path: str, origem: str, user_id: Optional[str]) -> Tuple[str, bool]:
+    # O arquivo aberto é repassado ao cliente, que o envia em streaming
+    with open(origem, "rb") as arquivo:
+        return _armazenar(safe_path, arquivo, user_id)
+
+
+def _metadados_arquivo(chat_id: int, safe_name: str, safe_path: str) -> Dict[str, Any]:
+    return {
         "chat_id": chat_id,
         "file_name": safe_name,
         "path": safe_path,
         "uploaded_at": datetime.datetime.utcnow().isoformat(),
     }
-    return supabase.table("files").insert(payload).execute()
 
 
-def listar_arquivos(chat_id: int) -> List[Dict[str, Any]]:
+def salvar_arquivo(
+    chat_id: int,
+    nome: str,
+    caminho: str,
+    dados_bytes: bytes,
+    user_id: Optional[str] = None,
+):
+    """Faz upload para o Storage e armazena metadados na tabela files."""
+    safe_name = sanitize_filename(nome)
+    safe_path = sanitize_storage_path(caminho or safe_name)
+
+    destino, _ = _armazenar(safe_path, dados_bytes, user_id)
+
+    payload = _metadados_arquivo(chat_id, safe_name, destino)
+    response = supabase.table("files").insert(payload).execute()
+    if destino != safe_path:
+        _restaurar_se_removido(destino, dados_bytes)
+    return response
+
+
+def salvar_arquivos(
+    chat_id: int,
+    arquivos: Sequence[Tuple[str, str, str]],
+    user_id: Optional[str] = None,
+) -> List[Optional[BaseException]]:
+    """Envia vários arquivos em paralelo e grava os metadados num único insert.
+
+    `arquivos` traz tuplas (nome, caminho no Storage, caminho local); o arquivo
+    local é enviado em streaming. Com deduplicação (e `user_id` informado), o
+    caminho recebido é substituído pelo endereço do conteúdo e arquivos já
+    armazenados não são reenviados. Retorna, na mesma ordem, None para cada arquivo salvo ou a
+    exceção que o impediu. Se o insert em lote falhar, os objetos criados
+    nesta chamada são removidos e todos os arquivos constam como falha.
+    Conteúdo deduplicado é conferido depois do insert e reenviado se uma
+    exclusão concorrente o removeu.
+    """
+    futuros = []
+    for nome, caminho, origem in arquivos:
+        safe_name = sanitize_filename(nome)
+        safe_path = sanitize_storage_path(caminho or safe_name)
+        futuro = _executor_uploads.submit(_armazenar_arquivo_local, safe_path, origem, user_id)
+        futuros.append((safe_name, safe_path, origem, futuro))
+
+    resultados: List[Optional[BaseException]] = []
+    # (posição em resultados, nome, destino, deduplicado, caminho local)
+    enviados: List[Tuple[int, str, str, bool, str]] = []
+    criados: List[str] = []
+    for posicao, (safe_name, safe_path, origem, futuro) in enumerate(futuros):
+        try:
+            destino, novo = futuro.result()
+        except Exception as exc:
+            resultados.append(exc)
+        else:
+            resultados.append(None)
+            enviados.append((posicao, safe_name, destino, destino != safe_path, origem))
+            if novo:
+                criados.append(destino)
+
+    if not enviados:
+        return resultados
+
+    payloads = [
+        _metadados_arquivo(chat_id, safe_name, destino)
+        for _, safe_name, destino, _, _ in enviados
+    ]
+    try:
+        supabase.table("files").insert(payloads).execute()
+    except Exception as exc:
+        if criados:
+            try:
+                supabase.storage.from_("uploads").remove(criados)
+            except Exception:
+                pass
+        return [erro if erro is not None else exc for erro in resultados]
+
+    conferencias: Dict[str, Any] = {}
+    for _, _, destino, deduplicado, origem in enviados:
+        if deduplicado and destino not in conferencias:
+            conferencias[destino] = _executor_uploads.submit(_restaurar_arquivo_local, destino, origem)
+    for posicao, _, destino, deduplicado, _ in enviados:
+        if not deduplicado:
+            continue
+        try:
+            conferencias[destino].result()
+        except Exception as exc:
+            resultados[posicao] = exc
+    return resultados
+
+
+def listar_arquivos(chat_id: int, access_token: Optional[str] = None) -> List[Dict[str, Any]]:
     """Retorna metadados de arquivos associados a um chat específico."""
     response = (
-        supabase
+        _cliente(access_token)
         .table("files")
         .select("id,file_name,path,uploaded_at")
         .eq("chat_id", chat_id)
@@ -94,47 +482,197 @@ def listar_arquivos(chat_id: int) -> List[Dict[str, Any]]:
     return response.data or []
 
 
-def deletar_chat(chat_id: int):
-    """Remove chat, mensagens e arquivos associados no Supabase."""
+def baixar_arquivo(caminho: str, destino: str, access_token: Optional[str] = None):
+    """Baixa um objeto do bucket uploads e grava em `destino`."""
+    dados = _cliente(access_token).storage.from_("uploads").download(caminho)
+    if isinstance(dados, dict) and dados.get("error"):
+        raise RuntimeError(f"Erro ao baixar arquivo: {dados['error']}")
+    with open(destino, "wb") as arquivo:
+        arquivo.write(dados)
+
+
+# Exclusão em segundo plano: {chat_id: status}; o chat some da listagem enquanto não falhar
+_LOTE_EXCLUSAO = int(os.getenv("DELETE_BATCH_SIZE", "100"))
+_executor_exclusoes = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DELETE_WORKERS", "2")),
+    thread_name_prefix="delete",
+)
+_exclusoes: Dict[int, Dict[str, Any]] = {}
+_exclusoes_lock = threading.Lock()
+
+
+def sem_excluidos(chats: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Remove da lista os chats com exclusão pendente ou em andamento."""
+    with _exclusoes_lock:
+        ocultos = {
+            chat_id for chat_id, status in _exclusoes.items()
+            if status["estado"] != "falhou"
+        }
+    return [chat for chat in chats if chat.get("id") not in ocultos]
+
+
+def _atualizar_exclusao(chat_id: int, **campos):
+    with _exclusoes_lock:
+        _exclusoes[chat_id].update(campos)
+
+
+def _em_lotes(itens: Sequence[Any], tamanho: int = _LOTE_EXCLUSAO) -> List[List[Any]]:
+    return [list(itens[i:i + tamanho]) for i in range(0, len(itens), tamanho)]
+
+
+def _executar_lotes(fn, cliente, lotes: List[List[Any]]):
+    """Roda `fn(cliente, lote)` em paralelo (com novas tentativas) e propaga o primeiro erro."""
+    futuros = [executar_em_segundo_plano(fn, cliente, lote) for lote in lotes]
+    for futuro in futuros:
+        futuro.result()
+
+
+def _apagar_linhas_files(cliente, ids: List[Any]):
+    cliente.table("files").delete().in_("id", ids).execute()
+
+
+def _remover_objetos(cliente, chat_id: int, caminhos: List[str]):
+    # Referências conferidas de novo logo antes do remove: um upload do mesmo
+    # conteúdo pode ter gravado sua linha de files depois da primeira checagem
+    referenciados = _caminhos_referenciados(caminhos, cliente, exceto_chat=chat_id)
+    orfaos = [caminho for caminho in caminhos if caminho not in referenciados]
+    if orfaos:
+        cliente.storage.from_("uploads").remove(orfaos)
+
+
+def _apagar_mensagens(cliente, chat_id: int):
+    # Um único DELETE por chat_id: o banco apaga as linhas sem ida e volta por lote
+    cliente.table("messages").delete().eq("chat_id", chat_id).execute()
+
+
+def _apagar_linha_chat(cliente, chat_id: int):
+    cliente.table("chats").delete().eq("id", chat_id).execute()
+
+
+def _executar_exclusao(
+    chat_id: int,
+    access_token: Optional[str],
+    ao_concluir: Optional[Callable[[int], None]],
+):
+    _atualizar_exclusao(chat_id, estado="executando")
+    try:
+        cliente = _cliente(access_token)
+        files_response = (
+            cliente
+            .table("files")
+            .select("id,path")
+            .eq("chat_id", chat_id)
+            .execute()
+        )
+
+        files_data = files_response.data or []
+        file_ids = [item.get("id") for item in files_data if item.get("id")]
+        file_paths = sorted({item.get("path") for item in files_data if item.get("path")})
+
+        # Objetos saem antes das linhas: se algo falhar no meio, as linhas que
+        # sobram ainda apontam para eles e uma nova exclusão os encontra.
+        # Conteúdo deduplicado: só sai o objeto que nenhum outro chat referencia.
+        referenciados = set()
+        for lote in _em_lotes(file_paths):
+            referenciados |= _caminhos_referenciados(lote, cliente, exceto_chat=chat_id)
+        orfaos = [caminho for caminho in file_paths if caminho not in referenciados]
+        _executar_lotes(
+            lambda cliente, lote: _remover_objetos(cliente, chat_id, lote),
+            cliente,
+            _em_lotes(orfaos),
+        )
+        _atualizar_exclusao(chat_id, objetos=len(orfaos))
+
+        _executar_lotes(_apagar_linhas_files, cliente, _em_lotes(file_ids))
+        _atualizar_exclusao(chat_id, arquivos=len(file_ids))
+
+        # Mensagens ainda na fila (inclusive um lote em envio) não chegam depois da exclusão
+        if _fila_mensagens is not None:
+            _fila_mensagens.descartar(lambda payload: payload.get("chat_id") == chat_id)
+        executar_em_segundo_plano(_apagar_mensagens, cliente, chat_id).result()
+        executar_em_segundo_plano(_apagar_linha_chat, cliente, chat_id).result()
+        _atualizar_chat_em_cache(chat_id, None)
+
+        if ao_concluir is not None:
+            ao_concluir(chat_id)
+    except Exception as exc:
+        _atualizar_exclusao(chat_id, estado="falhou", erro=str(exc), concluido_em=time.time())
+        raise
+    _atualizar_exclusao(chat_id, estado="concluida", concluido_em=time.time())
+
+
+def deletar_chat(
+    chat_id: int,
+    access_token: Optional[str] = None,
+    ao_concluir: Optional[Callable[[int], None]] = None,
+    em_segundo_plano: bool = True,
+):
+    """Remove chat, mensagens e arquivos associados no Supabase.
+
+    O chat é marcado como excluído na hora (some de listar_chats) e a remoção
+    roda em segundo plano, em lotes paralelos com novas tentativas; o andamento
+    fica em status_exclusao(). As requisições usam um cliente próprio com
+    `access_token` e `ao_concluir(chat_id)` roda ao fim (ex.: limpar o índice local).
+    Se a exclusão falhar, o chat volta a ser listado e pode ser excluído de novo.
+    """
     if not chat_id:
-        return
+        return None
 
-    files_response = (
-        supabase
-        .table("files")
-        .select("id,path")
-        .eq("chat_id", chat_id)
-        .execute()
-    )
+    with _exclusoes_lock:
+        atual = _exclusoes.get(chat_id)
+        if atual is not None and atual["estado"] in ("pendente", "executando"):
+            return atual.get("futuro")
+        _exclusoes[chat_id] = {
+            "estado": "pendente",
+            "erro": None,
+            "arquivos": 0,
+            "objetos": 0,
+            "iniciado_em": time.time(),
+            "concluido_em": None,
+        }
+    _atualizar_chat_em_cache(chat_id, None)
 
-    files_data = files_response.data or []
-    file_ids = [item.get("id") for item in files_data if item.get("id")]
-    file_paths = [item.get("path") for item in files_data if item.get("path")]
+    if not em_segundo_plano:
+        _executar_exclusao(chat_id, access_token, ao_concluir)
+        return None
 
-    if file_paths:
-        supabase.storage.from_("uploads").remove(file_paths)
+    futuro = _executor_exclusoes.submit(_executar_exclusao, chat_id, access_token, ao_concluir)
+    _atualizar_exclusao(chat_id, futuro=futuro)
+    return futuro
 
-    if file_ids:
-        supabase.table("files").delete().in_("id", file_ids).execute()
 
-    supabase.table("messages").delete().eq("chat_id", chat_id).execute()
-    supabase.table("chats").delete().eq("id", chat_id).execute()
+def status_exclusao(chat_id: int) -> Optional[Dict[str, Any]]:
+    """Estado da exclusão do chat: pendente, executando, concluida ou falhou (com erro)."""
+    with _exclusoes_lock:
+        status = _exclusoes.get(chat_id)
+        if status is None:
+            return None
+        return {chave: valor for chave, valor in status.items() if chave != "futuro"}
 
 
-def atualizar_titulo_chat(chat_id: int, novo_titulo: str):
-    """Atualiza o título de um chat específico."""
+def atualizar_titulo_chat(chat_id: int, novo_titulo: str, access_token: Optional[str] = None):
+    """Atualiza o título de um chat específico (em nome do dono de `access_token`, se informado)."""
     if not novo_titulo:
         return
-    supabase.table("chats").update({"title": novo_titulo}).eq("id", chat_id).execute()
+    _cliente(access_token).table("chats").update({"title": novo_titulo}).eq("id", chat_id).execute()
+    _atualizar_chat_em_cache(chat_id, {"title": novo_titulo})
 
 
 __all__ = [
     "listar_chats",
+    "sem_excluidos",
     "criar_chat",
     "salvar_mensagem",
+    "normalizar_timestamp",
+    "chave_mensagem",
+    "flush_mensagens",
+    "estado_mensagem",
     "buscar_historico",
     "salvar_arquivo",
+    "salvar_arquivos",
     "listar_arquivos",
+    "baixar_arquivo",
     "deletar_chat",
+    "status_exclusao",
     "atualizar_titulo_chat",
 ]
@@ -0,0 +1,104 @@
+"""Cache em disco de embeddings de chunks, indexado por hash do texto e modelo."""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+_LOTE_SQL = 500
+
+
+class EmbeddingCache:
+    """Guarda vetores em SQLite e descarta os menos usados ao passar de `max_itens`."""
+
+    def __init__(self, caminho: str, modelo: str, max_itens: int = 200_000):
+        self.caminho = caminho
+        self.modelo = modelo
+        self.max_itens = max_itens
+        self._lock = threading.Lock()
+
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " chave TEXT PRIMARY KEY,"
+                " vetor BLOB NOT NULL,"
+                " acessado_em REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_acesso ON embeddings (acessado_em)"
+            )
+
+    @contextmanager
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _chave(self, texto: str) -> str:
+        conteudo = f"{self.modelo}\x00{texto}".encode("utf-8")
+        return hashlib.sha256(conteudo).hexdigest()
+
+    def obter(self, textos: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Retorna o vetor de cada texto, ou None quando ainda não foi calculado."""
+        chaves = [self._chave(texto) for texto in textos]
+        encontrados = {}
+
+        with self._lock, self._conectar() as conn:
+            for inicio in range(0, len(chaves), _LOTE_SQL):
+                lote = list(set(chaves[inicio:inicio + _LOTE_SQL]))
+                marcadores = ",".join("?" * len(lote))
+                linhas = conn.execute(
+                    f"SELECT chave, vetor FROM embeddings WHERE chave IN ({marcadores})",
+                    lote,
+                ).fetchall()
+                for chave, vetor in linhas:
+                    encontrados[chave] = np.frombuffer(vetor, dtype="float32")
+
+            if encontrados:
+                agora = time.time()
+                conn.executemany(
+                    "UPDATE embeddings SET acessado_em = ? WHERE chave = ?",
+                    [(agora, chave) for chave in encontrados],
+                )
+
+        return [encontrados.get(chave) for chave in chaves]
+
+    def guardar(self, textos: Sequence[str], vetores: np.ndarray):
+        """Armazena os vetores calculados e aplica o limite de tamanho."""
+        if not len(textos):
+            return
+
+        agora = time.time()
+        linhas = [
+            (self._chave(texto), np.asarray(vetor, dtype="float32").tobytes(), agora)
+            for texto, vetor in zip(textos, vetores)
+        ]
+
+        with self._lock, self._conectar() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (chave, vetor, acessado_em) VALUES (?, ?, ?)",
+                linhas,
+            )
+            total = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            excesso = total - self.max_itens
+            if excesso > 0:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE chave IN ("
+                    " SELECT chave FROM embeddings ORDER BY acessado_em ASC LIMIT ?)",
+                    (excesso,),
+                )
+
+
+__all__ = ["EmbeddingCache"]
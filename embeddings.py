@@ -0,0 +1,231 @@
+"""Backends de embedding carregados sob demanda e compartilhados pelo processo."""
+
+from __future__ import annotations
+
+import abc
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Type
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+BACKEND = os.getenv("RAG_EMBED_BACKEND", "torch")
+BATCH_SIZE = int(os.getenv("RAG_ENCODE_BATCH_SIZE", "64"))
+# 0 mantém o padrão da biblioteca (normalmente todos os núcleos)
+THREADS = int(os.getenv("RAG_EMBED_THREADS", "0"))
+ONNX_FILE = os.getenv("RAG_ONNX_FILE", "onnx/model_qint8_avx2.onnx")
+# Perguntas recentes cujo embedding fica em memória
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024"))
+
+
+class EmbeddingBackend(abc.ABC):
+    """Interface comum: carrega o modelo uma única vez e gera vetores float32."""
+
+    nome = "base"
+
+    def __init__(self, batch_size: int = BATCH_SIZE, threads: int = THREADS):
+        self.batch_size = batch_size
+        self.threads = threads
+        self._modelo: Optional["SentenceTransformer"] = None
+        self._lock = threading.Lock()
+
+    @property
+    def identificador(self) -> str:
+        """Nome usado para separar vetores de backends diferentes em caches."""
+        return f"{MODEL_NAME}:{self.nome}"
+
+    @abc.abstractmethod
+    def _carregar(self) -> "SentenceTransformer":
+        """Carrega o modelo; chamado uma única vez, sob `_lock`."""
+
+    def modelo(self) -> "SentenceTransformer":
+        if self._modelo is None:
+            with self._lock:
+                if self._modelo is None:
+                    self._modelo = self._carregar()
+        return self._modelo
+
+    def encode(self, textos: List[str]) -> np.ndarray:
+        vetores = self.modelo().encode(
+            textos,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return np.asarray(vetores, dtype="float32")
+
+
+class TorchBackend(EmbeddingBackend):
+    """SentenceTransformer padrão (PyTorch) com controle de threads intra-op."""
+
+    nome = "torch"
+
+    def _carregar(self) -> "SentenceTransformer":
+        # Importação tardia: torch só é carregado quando o RAG é realmente usado
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        return SentenceTransformer(MODEL_NAME, device="cpu")
+
+
+class OnnxBackend(EmbeddingBackend):
+    """Mesmo MiniLM exportado para ONNX (por padrão a versão quantizada int8)."""
+
+    nome = "onnx"
+
+    def __init__(self, batch_size: int = BATCH_SIZE, threads: int = THREADS, arquivo: str = ONNX_FILE):
+        super().__init__(batch_size, threads)
+        self.arquivo = arquivo
+
+    @property
+    def identificador(self) -> str:
+        return f"{MODEL_NAME}:{self.nome}:{self.arquivo}"
+
+    def _carregar(self) -> "SentenceTransformer":
+        import onnxruntime as ort
+        from sentence_transformers import SentenceTransformer
+
+        opcoes = ort.SessionOptions()
+        if self.threads > 0:
+            opcoes.intra_op_num_threads = self.threads
+        return SentenceTransformer(
+            MODEL_NAME,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={
+                "file_name": self.arquivo,
+                "provider": "CPUExecutionProvider",
+                "session_options": opcoes,
+            },
+        )
+
+
+BACKENDS: Dict[str, Type[EmbeddingBackend]] = {
+    TorchBackend.nome: TorchBackend,
+    OnnxBackend.nome: OnnxBackend,
+}
+
+_backend: Optional[EmbeddingBackend] = None
+_lock = threading.Lock()
+_aquecimento: Optional[threading.Thread] = None
+
+_cache_consultas: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def criar_backend(nome: str, **kwargs) -> EmbeddingBackend:
+    try:
+        classe = BACKENDS[nome]
+    except KeyError:
+        raise ValueError(f"Backend de embedding desconhecido: {nome}") from None
+    return classe(**kwargs)
+
+
+def obter_backend() -> EmbeddingBackend:
+    """Retorna o backend configurado em RAG_EMBED_BACKEND (um por processo)."""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                _backend = criar_backend(BACKEND)
+    return _backend
+
+
+def identificador_modelo() -> str:
+    return obter_backend().identificador
+
+
+def encode(textos: List[str]) -> np.ndarray:
+    """Gera embeddings float32 para a lista de textos."""
+    return obter_backend().encode(textos)
+
+
+def normalizar_consulta(texto: str) -> str:
+    """Chave do cache: o MiniLM é uncased, então caixa e espaços não mudam o vetor."""
+    return " ".join(texto.split()).lower()
+
+
+def encode_consultas(perguntas: List[str]) -> np.ndarray:
+    """Embeddings de perguntas, reaproveitando as recentes e codificando o resto de uma vez."""
+    chaves = [normalizar_consulta(pergunta) for pergunta in perguntas]
+    vetores: List[Optional[np.ndarray]] = []
+    with _cache_lock:
+        for chave in chaves:
+            vetor = _cache_consultas.get(chave)
+            if vetor is not None:
+                _cache_consultas.move_to_end(chave)
+            vetores.append(vetor)
+
+    faltando = sorted({chave for chave, vetor in zip(chaves, vetores) if vetor is None})
+    if faltando:
+        novos = dict(zip(faltando, encode(faltando)))
+        with _cache_lock:
+            for chave, vetor in novos.items():
+                vetor.setflags(write=False)
+                _cache_consultas[chave] = vetor
+                _cache_consultas.move_to_end(chave)
+            while len(_cache_consultas) > QUERY_CACHE_SIZE:
+                _cache_consultas.popitem(last=False)
+        vetores = [novos.get(chave, vetor) for chave, vetor in zip(chaves, vetores)]
+
+    return np.vstack(vetores).astype("float32", copy=False)
+
+
+def aquecer(em_segundo_plano: bool = True):
+    """Carrega o modelo antecipadamente, opcionalmente em uma thread daemon."""
+    global _aquecimento
+    backend = obter_backend()
+    if not em_segundo_plano:
+        backend.modelo()
+        return
+
+    with _lock:
+        if _aquecimento is not None:
+            return
+        _aquecimento = threading.Thread(target=backend.modelo, name="embed-warmup", daemon=True)
+        _aquecimento.start()
+
+
+def medir_throughput(
+    textos: List[str],
+    backends: Iterable[str] = ("torch", "onnx"),
+    repeticoes: int = 3,
+    **kwargs,
+) -> Dict[str, float]:
+    """Compara backends em textos por segundo (melhor de `repeticoes` rodadas)."""
+    resultados: Dict[str, float] = {}
+    for nome in backends:
+        backend = criar_backend(nome, **kwargs)
+        backend.encode(textos[:1])
+        melhor = float("inf")
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            backend.encode(textos)
+            melhor = min(melhor, time.perf_counter() - inicio)
+        resultados[nome] = len(textos) / melhor
+    return resultados
+
+
+__all__ = [
+    "MODEL_NAME",
+    "EmbeddingBackend",
+    "TorchBackend",
+    "OnnxBackend",
+    "criar_backend",
+    "obter_backend",
+    "identificador_modelo",
+    "encode",
+    "encode_consultas",
+    "normalizar_consulta",
+    "aquecer",
+    "medir_throughput",
+]
@@ -0,0 +1,202 @@
+"""Extração de texto em fluxo (página ou parágrafo) e divisão em chunks."""
+
+import atexit
+import multiprocessing
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain, islice
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+from chunking import fatiar
+
+_TXT_BLOCO = 64 * 1024
+_PARAGRAFO_RE = re.compile(r"\n\s*\n")
+
+# Processos usados para extrair vários arquivos em paralelo (1 desativa o pool)
+_MAX_WORKERS = int(os.getenv("RAG_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# PDFs são divididos em tarefas de até N páginas (0 extrai o arquivo inteiro de uma vez)
+_PAGINAS_POR_TAREFA = int(os.getenv("RAG_EXTRACT_PAGES", "16"))
+
+# (caminho, página inicial, página final exclusiva ou None para ir até o fim)
+_Tarefa = Tuple[str, int, Optional[int]]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _paragrafos_pdf(
+    caminho: str, inicio: int = 0, fim: Optional[int] = None
+) -> Iterator[Optional[str]]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(caminho)
+    total = len(reader.pages)
+    for numero in range(inicio, total if fim is None else min(fim, total)):
+        texto = reader.pages[numero].extract_text() or ""
+        yield from _PARAGRAFO_RE.split(texto)
+        yield None
+
+
+def _paragrafos_docx(caminho: str) -> Iterator[Optional[str]]:
+    from docx import Document
+
+    doc = Document(caminho)
+    for paragrafo in doc.paragraphs:
+        yield paragrafo.text
+
+
+def _paragrafos_txt(caminho: str) -> Iterator[Optional[str]]:
+    """Parágrafos separados por linhas em branco, lidos em blocos de `_TXT_BLOCO`.
+
+    Parágrafos (ou linhas) gigantes são entregues em partes: um arquivo sem
+    quebras de linha não é carregado inteiro na memória.
+    """
+    linhas: List[str] = []
+    tamanho = 0
+    resto = ""
+    with open(caminho, "r", encoding="utf-8") as f:
+        while True:
+            bloco = f.read(_TXT_BLOCO)
+            *completas, resto = (resto + bloco).split("\n")
+            novas = [linha + "\n" for linha in completas]
+            if not bloco or len(resto) >= _TXT_BLOCO:
+                # Fim do arquivo ou linha gigante: o que sobrou entra sem esperar o "\n"
+                if resto:
+                    novas.append(resto)
+                resto = ""
+
+            for linha in novas:
+                if not linha.strip():
+                    if linhas:
+                        yield "".join(linhas)
+                    linhas, tamanho = [], 0
+                    continue
+                linhas.append(linha)
+                tamanho += len(linha)
+                if tamanho >= _TXT_BLOCO:
+                    yield "".join(linhas)
+                    linhas, tamanho = [], 0
+
+            if not bloco:
+                break
+    if linhas:
+        yield "".join(linhas)
+
+
+def iterar_paragrafos(caminho: str) -> Iterator[Optional[str]]:
+    """Gera os parágrafos do documento; `None` marca o fim de uma página."""
+    if caminho.endswith(".pdf"):
+        yield from _paragrafos_pdf(caminho)
+    elif caminho.endswith(".txt"):
+        yield from _paragrafos_txt(caminho)
+    elif caminho.endswith(".docx"):
+        yield from _paragrafos_docx(caminho)
+
+
+def _tarefas(caminho: str) -> Iterator[_Tarefa]:
+    """Divide o arquivo em tarefas; o fim de página já encerra o chunk em `fatiar`,
+    então extrair faixas de páginas separadamente gera os mesmos chunks."""
+    if caminho.endswith(".pdf") and _PAGINAS_POR_TAREFA > 0:
+        from pypdf import PdfReader
+
+        total = len(PdfReader(caminho).pages)
+        for inicio in range(0, total, _PAGINAS_POR_TAREFA):
+            yield caminho, inicio, inicio + _PAGINAS_POR_TAREFA
+    else:
+        yield caminho, 0, None
+
+
+def _chunks_da_tarefa(caminho: str, inicio: int, fim: Optional[int]) -> List[str]:
+    if caminho.endswith(".pdf"):
+        return list(fatiar(_paragrafos_pdf(caminho, inicio, fim)))
+    return list(fatiar(iterar_paragrafos(caminho)))
+
+
+def _obter_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "spawn" evita herdar threads e o estado do torch do processo do Streamlit
+            contexto = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=_MAX_WORKERS, mp_context=contexto)
+        return _pool
+
+
+def encerrar_pool():
+    """Finaliza os processos de extração (chamado automaticamente na saída)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(encerrar_pool)
+
+
+def iterar_chunks(caminhos: Iterable[str]) -> Iterator[str]:
+    """Gera os chunks de cada documento, na ordem dos caminhos recebidos.
+
+    Com mais de uma tarefa (arquivos, ou faixas de páginas de um PDF), a extração
+    roda num pool de processos com no máximo `_MAX_WORKERS` tarefas em andamento;
+    cada resultado é entregue assim que chega a sua vez, na ordem de `caminhos`.
+    """
+    caminhos = list(caminhos)
+    if _MAX_WORKERS <= 1:
+        for caminho in caminhos:
+            yield from fatiar(iterar_paragrafos(caminho))
+        return
+
+    tarefas = (tarefa for caminho in caminhos for tarefa in _tarefas(caminho))
+    primeiras = list(islice(tarefas, 2))
+    if len(primeiras) < 2:
+        # Uma tarefa só não compensa subir o pool
+        for tarefa in primeiras:
+            yield from _chunks_da_tarefa(*tarefa)
+        return
+    tarefas = chain(primeiras, tarefas)
+
+    em_andamento: Deque[Tuple[_Tarefa, Future]] = deque()
+
+    def _submeter() -> bool:
+        tarefa = next(tarefas, None)
+        if tarefa is None:
+            return False
+        em_andamento.append((tarefa, _obter_pool().submit(_chunks_da_tarefa, *tarefa)))
+        return True
+
+    try:
+        while len(em_andamento) < _MAX_WORKERS and _submeter():
+            pass
+        while em_andamento:
+            tarefa, futuro = em_andamento.popleft()
+            try:
+                chunks = futuro.result()
+            except BrokenProcessPool:
+                encerrar_pool()
+                chunks = _chunks_da_tarefa(*tarefa)
+            # Repõe a vaga antes de entregar: o pool extrai enquanto os chunks são indexados
+            _submeter()
+            yield from chunks
+    finally:
+        for _, futuro in em_andamento:
+            futuro.cancel()
+
+
+def em_lotes(chunks: Iterable[str], tamanho: int) -> Iterator[List[str]]:
+    """Agrupa um fluxo de chunks em listas de até `tamanho` itens."""
+    lote: List[str] = []
+    for chunk in chunks:
+        lote.append(chunk)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+__all__ = ["iterar_paragrafos", "iterar_chunks", "em_lotes", "encerrar_pool"]
@@ -0,0 +1,308 @@
+"""Escolha do tipo de índice FAISS: busca exata no início, aproximada em chats grandes."""
+
+from __future__ import annotations
+
+import math
+import os
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import faiss
+
+# Tipo aproximado usado após a migração: "hnsw", "ivf" ou "flat" (nunca migra)
+TIPO_APROXIMADO = os.getenv("RAG_ANN_TYPE", "hnsw")
+# Quantidade de vetores a partir da qual o chat deixa a busca exata
+LIMITE_MIGRACAO = int(os.getenv("RAG_ANN_THRESHOLD", "20000"))
+
+# Compressão dos vetores: "none" (float32, L2), "sq8" (int8, 4x) ou "pq" (PQ_M bytes)
+COMPRESSAO = os.getenv("RAG_VECTOR_COMPRESSION", "none")
+PQ_M = int(os.getenv("RAG_PQ_M", "96"))
+# Vetores necessários para treinar o quantizador; abaixo disso o chat fica em Flat
+MIN_TREINO = int(os.getenv("RAG_COMPRESS_MIN", "1000"))
+_MIN_TREINO_PQ = 4096
+
+# Parâmetros de recall x latência
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+
+_FAISS_THREADS = int(os.getenv("RAG_FAISS_THREADS", "0"))
+
+
+def importar_faiss():
+    """Importa o faiss sob demanda para não pesar no carregamento da interface."""
+    import faiss
+
+    if _FAISS_THREADS > 0:
+        faiss.omp_set_num_threads(_FAISS_THREADS)
+    return faiss
+
+
+def configurar_busca(ef_search: Optional[int] = None, nprobe: Optional[int] = None):
+    """Ajusta em tempo de execução os parâmetros usados nas próximas buscas."""
+    global HNSW_EF_SEARCH, IVF_NPROBE
+    if ef_search is not None:
+        HNSW_EF_SEARCH = ef_search
+    if nprobe is not None:
+        IVF_NPROBE = nprobe
+
+
+def _usa_cosseno(index: "faiss.Index") -> bool:
+    return index.metric_type == importar_faiss().METRIC_INNER_PRODUCT
+
+
+def _metrica_configurada() -> int:
+    faiss = importar_faiss()
+    if COMPRESSAO == "none":
+        return faiss.METRIC_L2
+    # Vetores normalizados + produto interno = similaridade de cosseno
+    return faiss.METRIC_INNER_PRODUCT
+
+
+def novo_indice(dim: int) -> "faiss.Index":
+    """Todo chat começa com busca exata; com compressão ativa, já em cosseno."""
+    faiss = importar_faiss()
+    if _metrica_configurada() == faiss.METRIC_INNER_PRODUCT:
+        return faiss.IndexFlatIP(dim)
+    return faiss.IndexFlatL2(dim)
+
+
+def tipo_do_indice(index: "faiss.Index") -> str:
+    faiss = importar_faiss()
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def _comprimido(index: "faiss.Index") -> bool:
+    faiss = importar_faiss()
+    if isinstance(index, faiss.IndexHNSW):
+        return not isinstance(faiss.downcast_index(index.storage), faiss.IndexFlat)
+    if isinstance(index, faiss.IndexIVF):
+        return not isinstance(index, faiss.IndexIVFFlat)
+    return not isinstance(index, faiss.IndexFlat)
+
+
+def _min_treino() -> int:
+    if COMPRESSAO == "pq":
+        return max(MIN_TREINO, _MIN_TREINO_PQ)
+    return MIN_TREINO
+
+
+def _codificacao() -> str:
+    if COMPRESSAO == "sq8":
+        return "SQ8"
+    if COMPRESSAO == "pq":
+        return f"PQ{PQ_M}"
+    return "Flat"
+
+
+def _estagio_alvo(n: int) -> Tuple[bool, bool]:
+    """(comprimido, aproximado) desejados para um chat com `n` vetores."""
+    comprimido = COMPRESSAO != "none" and n >= _min_treino()
+    aproximado = TIPO_APROXIMADO != "flat" and n >= LIMITE_MIGRACAO
+    return comprimido, aproximado
+
+
+def _descricao(n: int, comprimido: bool, aproximado: bool) -> str:
+    codificacao = _codificacao() if comprimido else "Flat"
+    if aproximado and TIPO_APROXIMADO == "ivf":
+        nlist = max(1, int(math.sqrt(n)))
+        return f"IVF{nlist},{codificacao}"
+    if aproximado:
+        if codificacao == "Flat":
+            return f"HNSW{HNSW_M}"
+        return f"HNSW{HNSW_M}_{codificacao}"
+    return codificacao
+
+
+def _normalizar(vetores: np.ndarray) -> np.ndarray:
+    vetores = np.ascontiguousarray(vetores, dtype="float32").copy()
+    importar_faiss().normalize_L2(vetores)
+    return vetores
+
+
+def _reconstruir(index: "faiss.Index") -> np.ndarray:
+    if tipo_do_indice(index) == "ivf":
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def construir(descricao: str, vetores: np.ndarray, metrica: int) -> "faiss.Index":
+    """Cria, treina (se preciso) e popula um índice a partir do index_factory."""
+    faiss = importar_faiss()
+    if metrica == faiss.METRIC_INNER_PRODUCT:
+        vetores = _normalizar(vetores)
+    index = faiss.index_factory(vetores.shape[1], descricao, metrica)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(vetores)
+    index.add(vetores)
+    return index
+
+
+def _estagio_migracao(index: "faiss.Index") -> Optional[Tuple[bool, bool]]:
+    """(comprimido, aproximado) para onde o índice deve migrar, ou None se já está lá."""
+    alvo_comprimido, alvo_aproximado = _estagio_alvo(index.ntotal)
+    atual_comprimido = _comprimido(index)
+    atual_aproximado = tipo_do_indice(index) != "flat"
+
+    comprimido = alvo_comprimido or atual_comprimido
+    aproximado = alvo_aproximado or atual_aproximado
+    if (comprimido, aproximado) == (atual_comprimido, atual_aproximado):
+        return None
+    return comprimido, aproximado
+
+
+def precisa_migrar(index: "faiss.Index") -> bool:
+    """Verificação barata (só metadados) feita antes de copiar o índice para migrar."""
+    return _estagio_migracao(index) is not None
+
+
+def talvez_migrar(
+    index: "faiss.Index",
+    fonte_vetores: Optional[Callable[[], Optional[np.ndarray]]] = None,
+) -> "faiss.Index":
+    """Troca o índice por um comprimido e/ou aproximado quando o chat cresce.
+
+    `fonte_vetores` pode devolver os vetores originais (sem perda); sem ela, os
+    vetores são reconstruídos do próprio índice.
+    """
+    estagio = _estagio_migracao(index)
+    if estagio is None:
+        return index
+    comprimido, aproximado = estagio
+    atual_comprimido = _comprimido(index)
+
+    vetores = fonte_vetores() if fonte_vetores is not None else None
+    if vetores is None or len(vetores) != index.ntotal:
+        vetores = _reconstruir(index)
+
+    metrica = _metrica_configurada()
+    if atual_comprimido:
+        # Não muda a métrica de um índice já comprimido
+        metrica = index.metric_type
+    return construir(_descricao(index.ntotal, comprimido, aproximado), vetores, metrica)
+
+
+def adicionar(index: "faiss.Index", emb: np.ndarray):
+    if _usa_cosseno(index):
+        emb = _normalizar(emb)
+    index.add(emb)
+
+
+def buscar(index: "faiss.Index", emb: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Executa a busca e devolve distâncias na escala L2 ao quadrado.
+
+    Índices em cosseno guardam vetores normalizados, onde ||a - b||² = 2 - 2·cos;
+    converter a similaridade mantém o significado de `rag._THRESHOLD`
+    (1.2 em L2² equivale a cosseno ≥ 0.4) para todos os tipos de índice.
+    """
+    tipo = tipo_do_indice(index)
+    if tipo == "hnsw":
+        index.hnsw.efSearch = max(HNSW_EF_SEARCH, k)
+    elif tipo == "ivf":
+        index.nprobe = IVF_NPROBE
+
+    if not _usa_cosseno(index):
+        return index.search(emb, k)
+
+    similaridades, indices = index.search(_normalizar(emb), k)
+    return 2.0 - 2.0 * similaridades, indices
+
+
+def _vetores_candidatos(index: "faiss.Index", ids: np.ndarray) -> np.ndarray:
+    """Lê só os vetores dos `ids` (decodificados, se o índice for comprimido)."""
+    faiss = importar_faiss()
+    if tipo_do_indice(index) == "ivf":
+        ivf = faiss.extract_index_ivf(index)
+        if ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.make_direct_map()
+    return index.reconstruct_batch(ids)
+
+
+def buscar_restrito(
+    index: "faiss.Index", emb: np.ndarray, k: int, ids: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Como `buscar`, mas só entre os `ids` candidatos (uma pergunta por vez).
+
+    Os candidatos são pontuados diretamente em qualquer tipo de índice: custo
+    proporcional a len(ids), sem percorrer o grafo HNSW nem as listas do IVF
+    (que, com um filtro pequeno, devolveriam menos de `k` resultados).
+    """
+    ids = np.asarray(ids, dtype="int64")
+    cosseno = _usa_cosseno(index)
+    consulta = _normalizar(emb) if cosseno else np.asarray(emb, dtype="float32")
+
+    vetores = _vetores_candidatos(index, ids)
+    if cosseno:
+        distancias = 2.0 - 2.0 * (vetores @ consulta[0])
+    else:
+        distancias = ((vetores - consulta[0]) ** 2).sum(axis=1)
+    ordem = np.argsort(distancias, kind="stable")[:k]
+    return distancias[ordem][None, :], ids[ordem][None, :]
+
+
+def estimar_bytes(index: "faiss.Index") -> int:
+    """Memória aproximada ocupada pelos vetores (e grafo, no HNSW) do índice."""
+    faiss = importar_faiss()
+    base = index
+    extra = 0
+    if isinstance(index, faiss.IndexHNSW):
+        base = faiss.downcast_index(index.storage)
+        # Vizinhos do nível 0 (2·M ids de 4 bytes) dominam o custo do grafo
+        extra = index.ntotal * index.hnsw.nb_neighbors(0) * 4
+    try:
+        por_vetor = base.sa_code_size()
+    except RuntimeError:
+        por_vetor = 4 * index.d
+    return index.ntotal * por_vetor + extra
+
+
+def medir_recall(vetores: np.ndarray, consultas: np.ndarray, k: int = 5) -> Dict[str, float]:
+    """Compara a configuração atual com a busca exata: recall@k e bytes por vetor."""
+    faiss = importar_faiss()
+    exato = faiss.IndexFlatL2(vetores.shape[1])
+    exato.add(_normalizar(vetores))
+    _, esperados = exato.search(_normalizar(consultas), k)
+
+    comprimido, aproximado = _estagio_alvo(len(vetores))
+    index = construir(
+        _descricao(len(vetores), comprimido, aproximado), vetores, _metrica_configurada()
+    )
+    _, obtidos = buscar(index, consultas, k)
+
+    acertos = sum(
+        len(set(esperado) & set(obtido)) for esperado, obtido in zip(esperados, obtidos)
+    )
+    codificacao = faiss.index_factory(vetores.shape[1], _codificacao(), _metrica_configurada())
+    return {
+        "recall": acertos / float(esperados.size),
+        "bytes_por_vetor": float(codificacao.sa_code_size()),
+        "bytes_float32": float(4 * vetores.shape[1]),
+    }
+
+
+__all__ = [
+    "LIMITE_MIGRACAO",
+    "TIPO_APROXIMADO",
+    "COMPRESSAO",
+    "importar_faiss",
+    "configurar_busca",
+    "novo_indice",
+    "tipo_do_indice",
+    "construir",
+    "precisa_migrar",
+    "talvez_migrar",
+    "adicionar",
+    "buscar",
+    "buscar_restrito",
+    "estimar_bytes",
+    "medir_recall",
+]
@@ -0,0 +1,120 @@
+"""Índice invertido BM25 em memória para busca lexical por chat."""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Set, Tuple
+
+# Mantém identificadores como "ABC-123", "12/2024" ou "v1.2" inteiros
+_TERMO_RE = re.compile(r"\w+(?:[-/.]\w+)*")
+_PARTE_RE = re.compile(r"\w+")
+# Termos com dígitos, "-" ou "/" (códigos, datas, versões) identificam um trecho
+_IDENTIFICADOR_RE = re.compile(r"[\d/-]")
+
+
+def _sem_acentos(texto: str) -> str:
+    normalizado = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in normalizado if not unicodedata.combining(c))
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Termos em minúsculas e sem acento; compostos também geram suas partes."""
+    termos: List[str] = []
+    for termo in _TERMO_RE.findall(_sem_acentos(texto.lower())):
+        termos.append(termo)
+        partes = _PARTE_RE.findall(termo)
+        if len(partes) > 1:
+            termos.extend(partes)
+    return termos
+
+
+def eh_identificador(termo: str) -> bool:
+    return _IDENTIFICADOR_RE.search(termo) is not None
+
+
+class BM25Index:
+    """Postings `termo -> {chunk: frequência}`; ids seguem a ordem dos chunks do chat."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.tamanhos: List[int] = []
+        self._soma_tamanhos = 0
+
+    def __len__(self) -> int:
+        return len(self.tamanhos)
+
+    def adicionar(self, chunks: List[str]):
+        for chunk in chunks:
+            doc_id = len(self.tamanhos)
+            termos = tokenizar(chunk)
+            for termo, freq in Counter(termos).items():
+                self.postings.setdefault(termo, {})[doc_id] = freq
+            self.tamanhos.append(len(termos))
+            self._soma_tamanhos += len(termos)
+
+    def idf(self, termo: str) -> float:
+        df = len(self.postings.get(termo, ()))
+        n = len(self.tamanhos)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def buscar(self, consulta: str, k: int, idf_min: float = 0.0) -> List[Tuple[int, float]]:
+        """Top-k (chunk, score) considerando só termos com IDF >= `idf_min`."""
+        if not self.tamanhos:
+            return []
+
+        media = self._soma_tamanhos / len(self.tamanhos) or 1.0
+        scores: Dict[int, float] = {}
+        for termo in set(tokenizar(consulta)):
+            postings = self.postings.get(termo)
+            if not postings:
+                continue
+            idf = self.idf(termo)
+            if idf < idf_min:
+                continue
+            for doc_id, freq in postings.items():
+                norma = self.k1 * (1 - self.b + self.b * self.tamanhos[doc_id] / media)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norma)
+
+        melhores = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return melhores[:k]
+
+    def com_identificadores(self, consulta: str, idf_min: float = 0.0) -> Set[int]:
+        """Chunks que contêm algum identificador da consulta com IDF >= `idf_min`."""
+        encontrados: Set[int] = set()
+        for termo in set(tokenizar(consulta)):
+            if eh_identificador(termo) and termo in self.postings and self.idf(termo) >= idf_min:
+                encontrados.update(self.postings[termo])
+        return encontrados
+
+    def estimar_bytes(self) -> int:
+        # Aproximação: ~100 bytes por entrada de posting e ~80 por termo
+        entradas = sum(len(p) for p in self.postings.values())
+        return entradas * 100 + len(self.postings) * 80 + len(self.tamanhos) * 8
+
+    def para_dict(self) -> Dict[str, Any]:
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "tamanhos": self.tamanhos,
+            "postings": {
+                termo: [[doc_id, freq] for doc_id, freq in docs.items()]
+                for termo, docs in self.postings.items()
+            },
+        }
+
+    @classmethod
+    def de_dict(cls, dados: Dict[str, Any]) -> "BM25Index":
+        index = cls(dados.get("k1", 1.5), dados.get("b", 0.75))
+        index.tamanhos = list(dados.get("tamanhos", []))
+        index._soma_tamanhos = sum(index.tamanhos)
+        index.postings = {
+            termo: {doc_id: freq for doc_id, freq in docs}
+            for termo, docs in dados.get("postings", {}).items()
+        }
+        return index
+
+
+__all__ = ["BM25Index", "eh_identificador", "tokenizar"]
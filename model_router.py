@@ -0,0 +1,239 @@
+"""Fallback entre modelos com prazos, requisições hedged e circuit breaker."""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Prazo (s) de cada chamada; pode ser ajustado por modelo com definir_prazo()
+PRAZO_PADRAO = float(os.getenv("LLM_DEADLINE_S", "20"))
+
+# Hedge: dispara o próximo modelo se o atual passar do percentil de latência
+HEDGE_ATIVO = os.getenv("LLM_HEDGE", "1") != "0"
+HEDGE_PERCENTIL = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_ATRASO_PADRAO = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_S", "3"))
+_HEDGE_MIN_AMOSTRAS = 20
+
+# Circuit breaker: após N falhas seguidas o modelo é pulado por um tempo
+BREAKER_FALHAS = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+BREAKER_ESPERA = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+
+# Chamadas simultâneas (com hedge, cada pergunta pode ocupar mais de uma)
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "8"))
+
+_prazos: Dict[str, float] = {}
+_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+
+
+class FalhaNosModelos(RuntimeError):
+    """Nenhum modelo respondeu; `erros` guarda (modelo, exceção) de cada tentativa."""
+
+    def __init__(self, erros: List[Tuple[str, BaseException]]):
+        self.erros = erros
+        detalhes = "; ".join(f"{modelo}: {erro}" for modelo, erro in erros)
+        super().__init__(detalhes or "nenhum modelo disponível")
+
+
+class CircuitBreaker:
+    """Estados: fechado (normal), aberto (pula o modelo) e meio-aberto (uma tentativa)."""
+
+    def __init__(self, falhas_para_abrir: int = BREAKER_FALHAS, espera: float = BREAKER_ESPERA):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.espera = espera
+        self.falhas_seguidas = 0
+        self.aberto_em: Optional[float] = None
+        self._testando = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self) -> str:
+        if self.aberto_em is None:
+            return "fechado"
+        if time.monotonic() - self.aberto_em >= self.espera:
+            return "meio-aberto"
+        return "aberto"
+
+    def permite(self) -> bool:
+        with self._lock:
+            estado = self.estado
+            if estado == "fechado":
+                return True
+            if estado == "meio-aberto" and not self._testando:
+                self._testando = True
+                return True
+            return False
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.falhas_seguidas = 0
+            self.aberto_em = None
+            self._testando = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas_seguidas += 1
+            if self._testando or self.falhas_seguidas >= self.falhas_para_abrir:
+                self.aberto_em = time.monotonic()
+            self._testando = False
+
+
+class _Latencias:
+    def __init__(self, tamanho: int = 200):
+        self.amostras: Deque[float] = deque(maxlen=tamanho)
+        self.sucessos = 0
+        self.falhas = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, segundos: float):
+        with self._lock:
+            self.amostras.append(segundos)
+            self.sucessos += 1
+
+    def percentil(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self.amostras:
+                return None
+            ordenadas = sorted(self.amostras)
+        posicao = min(len(ordenadas) - 1, int(round(p / 100.0 * (len(ordenadas) - 1))))
+        return ordenadas[posicao]
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencias: Dict[str, _Latencias] = {}
+_registro_lock = threading.Lock()
+
+
+def _breaker(modelo: str) -> CircuitBreaker:
+    with _registro_lock:
+        return _breakers.setdefault(modelo, CircuitBreaker())
+
+
+def _latencia(modelo: str) -> _Latencias:
+    with _registro_lock:
+        return _latencias.setdefault(modelo, _Latencias())
+
+
+def definir_prazo(modelo: str, segundos: float):
+    _prazos[modelo] = segundos
+
+
+def _atraso_hedge(modelo: str) -> float:
+    latencias = _latencia(modelo)
+    if len(latencias.amostras) < _HEDGE_MIN_AMOSTRAS:
+        return HEDGE_ATRASO_PADRAO
+    return latencias.percentil(HEDGE_PERCENTIL) or HEDGE_ATRASO_PADRAO
+
+
+def _chamar_medido(modelo: str, chamada: Callable[[str, float], T]) -> T:
+    inicio = time.monotonic()
+    try:
+        resultado = chamada(modelo, _prazos.get(modelo, PRAZO_PADRAO))
+    except BaseException:
+        _breaker(modelo).registrar_falha()
+        _latencia(modelo).falhas += 1
+        raise
+    _breaker(modelo).registrar_sucesso()
+    _latencia(modelo).registrar(time.monotonic() - inicio)
+    return resultado
+
+
+def _descartar_quando_pronto(futuro: Future, descartar: Callable[[Any], None]):
+    def _callback(f: Future):
+        if f.cancelled() or f.exception() is not None:
+            return
+        try:
+            descartar(f.result())
+        except Exception:
+            pass
+
+    futuro.add_done_callback(_callback)
+
+
+def executar_com_fallback(
+    modelos: Sequence[str],
+    chamada: Callable[[str, float], T],
+    descartar: Optional[Callable[[T], None]] = None,
+) -> T:
+    """Chama `chamada(modelo, prazo)` seguindo a ordem de `modelos`.
+
+    Modelos com o breaker aberto são pulados. Se o modelo em andamento passar do
+    percentil configurado de latência, o próximo é disparado em paralelo e vence
+    quem responder primeiro com sucesso; o resultado perdedor vai para `descartar`
+    (ex.: fechar um stream).
+    """
+    fila = list(modelos)
+    erros: List[Tuple[str, BaseException]] = []
+    pendentes: Dict[Future, str] = {}
+    ultimo: Optional[str] = None
+
+    def _disparar() -> bool:
+        nonlocal ultimo
+        while fila:
+            modelo = fila.pop(0)
+            # Consultado só na hora do disparo para não gastar a tentativa do meio-aberto
+            if _breaker(modelo).permite():
+                ultimo = modelo
+                pendentes[_executor.submit(_chamar_medido, modelo, chamada)] = modelo
+                return True
+        return False
+
+    if fila:
+        _disparar()
+
+    while pendentes:
+        atraso = _atraso_hedge(ultimo) if HEDGE_ATIVO and fila else None
+        prontos, _ = wait(list(pendentes), timeout=atraso, return_when=FIRST_COMPLETED)
+        if not prontos:
+            _disparar()
+            continue
+
+        for futuro in prontos:
+            modelo = pendentes.pop(futuro)
+            try:
+                resultado = futuro.result()
+            except Exception as exc:
+                erros.append((modelo, exc))
+                continue
+
+            if descartar is not None:
+                for restante in pendentes:
+                    _descartar_quando_pronto(restante, descartar)
+            return resultado
+
+        if not pendentes and fila:
+            _disparar()
+
+    raise FalhaNosModelos(erros)
+
+
+def estado_modelos() -> Dict[str, Dict[str, Any]]:
+    """Estado do breaker e estatísticas de latência (s) de cada modelo já usado."""
+    with _registro_lock:
+        nomes = sorted(set(_breakers) | set(_latencias))
+    estado: Dict[str, Dict[str, Any]] = {}
+    for modelo in nomes:
+        breaker = _breaker(modelo)
+        latencias = _latencia(modelo)
+        estado[modelo] = {
+            "breaker": breaker.estado,
+            "falhas_seguidas": breaker.falhas_seguidas,
+            "sucessos": latencias.sucessos,
+            "falhas": latencias.falhas,
+            "p50": latencias.percentil(50),
+            "p95": latencias.percentil(95),
+            "prazo": _prazos.get(modelo, PRAZO_PADRAO),
+        }
+    return estado
+
+
+__all__ = [
+    "CircuitBreaker",
+    "FalhaNosModelos",
+    "definir_prazo",
+    "executar_com_fallback",
+    "estado_modelos",
+]
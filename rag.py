@@ -1,85 +1,532 @@
-from typing import Dict, List
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from pypdf import PdfReader
-from docx import Document
 
-# Modelo de embedding
-embed_model = SentenceTransformer("all-MiniLM-L6-v2")
+import answer_cache
+import embeddings
+from embedding_cache import EmbeddingCache
+from extraction import em_lotes, iterar_chunks
+from index_manager import (
+    adicionar,
+    buscar,
+    buscar_restrito,
+    estimar_bytes,
+    importar_faiss,
+    novo_indice,
+    precisa_migrar,
+    talvez_migrar,
+)
+from lexical_index import BM25Index
+
+if TYPE_CHECKING:
+    import faiss
+
+logger = logging.getLogger(__name__)
 
 # Índices e chunks por chat
-_indices_por_chat: Dict[int, faiss.IndexFlatL2] = {}
+_indices_por_chat: Dict[int, faiss.Index] = {}
 _chunks_por_chat: Dict[int, List[str]] = {}
+_lexicos_por_chat: Dict[int, BM25Index] = {}
 _THRESHOLD = 1.2
 
+# Busca híbrida: ranking vetorial + BM25 fundidos por Reciprocal Rank Fusion
+_BUSCA_HIBRIDA = os.getenv("RAG_HYBRID", "1") != "0"
+_RRF_K = 60
+# Termos muito comuns no chat (IDF baixo) não contam no BM25. Um trecho só entra
+# pelo BM25 sem passar do _THRESHOLD vetorial se contiver um identificador da
+# pergunta (código, data, versão): palavras comuns como "qual" não o resgatam
+_IDF_MIN = float(os.getenv("RAG_LEXICAL_IDF_MIN", "1.0"))
+# A partir deste tamanho, o vetor é comparado só com os candidatos do BM25
+_PREFILTRO_MIN = int(os.getenv("RAG_LEXICAL_PREFILTER_MIN", "50000"))
+_PREFILTRO_CANDIDATOS = int(os.getenv("RAG_LEXICAL_PREFILTER_CANDIDATES", "256"))
+
+# Quantidade de chunks embutidos e indexados por vez durante a ingestão
+_TAMANHO_LOTE = int(os.getenv("RAG_EMBED_BATCH", "256"))
+
+# Persistência local dos índices (um diretório por chat)
+_INDEX_DIR = Path(os.getenv("RAG_INDEX_DIR", ".rag_index"))
+_INDEX_FILE = "index.faiss"
+_CHUNKS_FILE = "chunks.json"
+_LEXICAL_FILE = "lexical.json"
+
+# Chats cujo índice em memória foi aberto via mmap (somente leitura)
+_indices_somente_leitura: Set[int] = set()
+_lock = threading.RLock()
+
+# Orçamento global de memória: chats ociosos saem primeiro (LRU) e voltam do disco
+_ORCAMENTO_BYTES = int(float(os.getenv("RAG_MEMORY_BUDGET_MB", "512")) * 1024 * 1024)
+_uso_por_chat: "OrderedDict[int, int]" = OrderedDict()
+# Ingestões em andamento por chat (várias podem se sobrepor no mesmo chat)
+_em_ingestao: Dict[int, int] = {}
+_estatisticas = {"hits": 0, "misses": 0, "evictions": 0}
+
+# Cache de embeddings compartilhado entre chats (reenvio do mesmo arquivo não recalcula)
+_embedding_cache = EmbeddingCache(
+    str(_INDEX_DIR / "embeddings.sqlite3"),
+    embeddings.identificador_modelo(),
+    max_itens=int(os.getenv("RAG_EMBED_CACHE_MAX", "200000")),
+)
+
+
+# Reidratação: chats sem índice local são reconstruídos a partir dos arquivos remotos.
+# listar(chat_id, access_token) -> [(nome do arquivo, caminho remoto)];
+# baixar(caminho remoto, destino local, access_token). O token identifica o dono
+# quando a chamada roda fora da sessão dele (None: sessão atual do cliente).
+ListarArquivos = Callable[[int, Optional[str]], List[Tuple[str, str]]]
+BaixarArquivo = Callable[[str, str, Optional[str]], None]
+_fonte_arquivos: Optional[Tuple[ListarArquivos, BaixarArquivo]] = None
+# Chats sem arquivos remotos não são consultados de novo antes deste intervalo (s)
+_REIDRATAR_NOVAMENTE = float(os.getenv("RAG_REHYDRATE_RETRY_S", "60"))
+_sem_arquivos_remotos: Dict[int, float] = {}
+_locks_reidratacao: Dict[int, threading.Lock] = {}
+# Gravações em disco de cada chat, em ordem (a cópia mais nova chega por último)
+_locks_gravacao: Dict[int, threading.Lock] = {}
+# Incrementada a cada exclusão: leituras do disco já em curso não reinstalam o chat
+_geracoes: Dict[int, int] = {}
+# Pool próprio: reconstruções longas não disputam threads com as gravações do chat
+_executor_pre_carga = ThreadPoolExecutor(
+    max_workers=int(os.getenv("RAG_PREFETCH_WORKERS", "1")),
+    thread_name_prefix="rag-prefetch",
+)
+
+
+def aquecer_modelo(em_segundo_plano: bool = True):
+    """Antecipa o carregamento do modelo de embedding (ex.: logo após o login)."""
+    embeddings.aquecer(em_segundo_plano)
+
 
 def carregar_arquivos(caminhos, chat_id: int) -> int:
     """Carrega arquivos do chat informado e atualiza o índice correspondente."""
     if not caminhos:
         return 0
 
-    novos_chunks = _extrair_chunks(caminhos)
-    if not novos_chunks:
+    with _lock:
+        _em_ingestao[chat_id] = _em_ingestao.get(chat_id, 0) + 1
+
+    total = 0
+    try:
+        for lote in em_lotes(iterar_chunks(caminhos), _TAMANHO_LOTE):
+            emb = _gerar_embeddings(lote)
+
+            with _lock:
+                ler_do_disco = not _gravavel_em_memoria(chat_id)
+            # Leitura e parse do disco fora do lock, como a gravação abaixo
+            do_disco = _abrir_do_disco(chat_id, somente_leitura=False) if ler_do_disco else None
+
+            with _lock:
+                index, chunk_list, lexico = _obter_indice_gravavel(chat_id, do_disco)
+                if index is None:
+                    index = novo_indice(emb.shape[1])
+                    chunk_list = []
+                    lexico = BM25Index()
+
+                chunk_list.extend(lote)
+                adicionar(index, emb)
+                lexico.adicionar(lote)
+
+                _indices_por_chat[chat_id] = index
+                _chunks_por_chat[chat_id] = chunk_list
+                _lexicos_por_chat[chat_id] = lexico
+            total += len(lote)
+
+        if total:
+            _migrar_fora_do_lock(chat_id)
+            _salvar_em_disco(chat_id)
+            answer_cache.invalidar_chat(chat_id)
+    finally:
+        with _lock:
+            if _em_ingestao[chat_id] > 1:
+                _em_ingestao[chat_id] -= 1
+            else:
+                del _em_ingestao[chat_id]
+            if chat_id in _indices_por_chat:
+                _registrar_uso(chat_id)
+
+    return total
+
+
+def _migrar_fora_do_lock(chat_id: int):
+    """Reconstrói o índice migrado sem segurar `_lock` e o troca se nada mudou.
+
+    Treinar IVF/PQ ou montar o grafo HNSW leva segundos; com o lock global isso
+    pararia as buscas de todos os chats. Só a cópia e a troca ficam sob o lock.
+    """
+    with _lock:
+        atual = _indices_por_chat.get(chat_id)
+        if atual is None or not precisa_migrar(atual):
+            return
+        copia = importar_faiss().clone_index(atual)
+        chunks = list(_chunks_por_chat[chat_id])
+
+    migrado = talvez_migrar(copia, lambda: _vetores_em_cache(chunks))
+
+    with _lock:
+        # Outra ingestão no meio do caminho: ela migra de novo ao terminar
+        if _indices_por_chat.get(chat_id) is atual and atual.ntotal == migrado.ntotal:
+            _indices_por_chat[chat_id] = migrado
+
+
+def definir_fonte_arquivos(listar: Optional[ListarArquivos], baixar: Optional[BaixarArquivo] = None):
+    """Registra de onde vêm os arquivos de um chat sem índice local (None desativa)."""
+    global _fonte_arquivos
+    _fonte_arquivos = (listar, baixar) if listar is not None and baixar is not None else None
+
+
+def reidratar_chat(chat_id: int, access_token: Optional[str] = None) -> int:
+    """Reconstrói o índice do chat baixando seus arquivos, se ele não existir localmente.
+
+    Retorna o número de chunks indexados (0 se o índice já existia ou não há
+    arquivos). Chamadas simultâneas para o mesmo chat esperam a primeira.
+    """
+    fonte = _fonte_arquivos
+    if fonte is None:
         return 0
 
-    chunk_list = _chunks_por_chat.setdefault(chat_id, [])
-    chunk_list.extend(novos_chunks)
+    with _lock:
+        trava = _locks_reidratacao.setdefault(chat_id, threading.Lock())
 
-    emb = embed_model.encode(novos_chunks)
-    emb = np.array(emb, dtype="float32")
+    with trava:
+        with _lock:
+            if _indice_disponivel(chat_id):
+                return 0
+            sem_arquivos_desde = _sem_arquivos_remotos.get(chat_id)
+            if sem_arquivos_desde is not None and time.monotonic() - sem_arquivos_desde < _REIDRATAR_NOVAMENTE:
+                return 0
+
+        listar, baixar = fonte
+        # Conteúdo deduplicado: nomes diferentes podem apontar para o mesmo objeto
+        arquivos = list(dict((caminho, nome) for nome, caminho in listar(chat_id, access_token)).items())
+        if not arquivos:
+            with _lock:
+                _sem_arquivos_remotos[chat_id] = time.monotonic()
+            return 0
+
+        with tempfile.TemporaryDirectory(prefix=f"rag_{chat_id}_") as pasta:
+            caminhos = []
+            for i, (remoto, nome) in enumerate(arquivos):
+                # Prefixo evita colisão de nomes; a extensão decide o extrator
+                destino = os.path.join(pasta, f"{i}_{os.path.basename(nome)}")
+                try:
+                    baixar(remoto, destino, access_token)
+                except Exception as exc:
+                    logger.warning("Falha ao baixar %s do chat %s: %s", remoto, chat_id, exc)
+                    continue
+                caminhos.append(destino)
+
+            total = carregar_arquivos(caminhos, chat_id)
+
+        with _lock:
+            _sem_arquivos_remotos.pop(chat_id, None)
+        logger.info("Chat %s reidratado com %d chunks de %d arquivos", chat_id, total, len(caminhos))
+        return total
 
-    index = _indices_por_chat.get(chat_id)
-    if index is None:
-        index = faiss.IndexFlatL2(emb.shape[1])
-        _indices_por_chat[chat_id] = index
 
-    index.add(emb)
-    return len(novos_chunks)
+def pre_carregar_chats(chat_ids: Iterable[int], access_token: Optional[str] = None):
+    """Reidrata em sequência os chats informados, em nome do dono de `access_token`."""
+    for chat_id in chat_ids:
+        try:
+            reidratar_chat(chat_id, access_token)
+        except Exception as exc:
+            logger.warning("Falha ao pré-carregar o chat %s: %s", chat_id, exc)
+
+
+def pre_carregar_em_segundo_plano(chat_ids: Iterable[int], access_token: Optional[str] = None) -> Future:
+    """Agenda pre_carregar_chats no pool de pré-carga (ex.: logo após o login)."""
+    return _executor_pre_carga.submit(pre_carregar_chats, list(chat_ids), access_token)
 
 
 def buscar_contexto(pergunta, chat_id: int, k=5) -> List[str]:
-    index = _indices_por_chat.get(chat_id)
-    chunk_list = _chunks_por_chat.get(chat_id)
-    if index is None or not chunk_list:
+    return buscar_contextos([pergunta], chat_id, k=k)[0]
+
+
+def buscar_contextos(perguntas: List[str], chat_id: int, k=5) -> List[List[str]]:
+    """Busca várias perguntas no mesmo chat com um único encode e um único search."""
+    if not perguntas:
         return []
 
-    emb = embed_model.encode([pergunta]).astype("float32")
-    distancias, indices = index.search(emb, k)
+    index, chunk_list, lexico = _obter_indice(chat_id)
+    if index is None and _fonte_arquivos is not None and reidratar_chat(chat_id):
+        index, chunk_list, lexico = _obter_indice(chat_id)
+    if index is None or not chunk_list:
+        return [[] for _ in perguntas]
+
+    perguntas = list(perguntas)
+    emb = embeddings.encode_consultas(perguntas)
+
+    usar_lexico = _BUSCA_HIBRIDA and lexico is not None
+    prefiltrar = usar_lexico and len(chunk_list) >= _PREFILTRO_MIN
+    n_lexicos = _PREFILTRO_CANDIDATOS if prefiltrar else k
+    lexicais = [
+        [doc_id for doc_id, _ in lexico.buscar(pergunta, n_lexicos, _IDF_MIN)]
+        if usar_lexico else []
+        for pergunta in perguntas
+    ]
+
+    if prefiltrar:
+        linhas = []
+        for i, candidatos in enumerate(lexicais):
+            consulta = emb[i:i + 1]
+            if len(candidatos) >= k:
+                distancias, indices = buscar_restrito(index, consulta, k, np.array(candidatos))
+            else:
+                distancias, indices = buscar(index, consulta, k)
+            linhas.append((distancias[0], indices[0]))
+    else:
+        distancias, indices = buscar(index, emb, k)
+        linhas = list(zip(distancias, indices))
+
+    todos = []
+    for pergunta, (linha_dist, linha_idx), candidatos in zip(perguntas, linhas, lexicais):
+        vetoriais = [
+            int(i)
+            for dist, i in zip(linha_dist, linha_idx)
+            if dist < _THRESHOLD and 0 <= i < len(chunk_list)
+        ]
+        if candidatos:
+            aceitos = set(vetoriais) | lexico.com_identificadores(pergunta, _IDF_MIN)
+            candidatos = [doc_id for doc_id in candidatos if doc_id in aceitos]
+        ids = _fundir_rankings([vetoriais, candidatos[:k]], k)
+        todos.append([chunk_list[i] for i in ids if i < len(chunk_list)])
 
-    resultados = []
-    for dist, i in zip(distancias[0], indices[0]):
-        if dist < _THRESHOLD and 0 <= i < len(chunk_list):
-            resultados.append(chunk_list[i])
+    return todos
 
-    return resultados
+
+def _fundir_rankings(rankings: List[List[int]], k: int) -> List[int]:
+    """Reciprocal Rank Fusion: soma 1/(RRF_K + posição) de cada ranking."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for posicao, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (_RRF_K + posicao + 1)
+    return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))[:k]
 
 
 def limpar_chat_contexto(chat_id: int):
     """Remove índice e chunks associados a um chat (ex.: após exclusão)."""
+    with _trava_gravacao(chat_id), _lock:
+        _descartar_da_memoria(chat_id)
+        _sem_arquivos_remotos.pop(chat_id, None)
+        _geracoes[chat_id] = _geracoes.get(chat_id, 0) + 1
+        shutil.rmtree(_dir_chat(chat_id), ignore_errors=True)
+    answer_cache.invalidar_chat(chat_id)
+
+
+def estatisticas_cache() -> Dict[str, int]:
+    """Hits, misses e evictions do cache de índices, além da memória estimada em uso."""
+    with _lock:
+        return {
+            **_estatisticas,
+            "chats_em_memoria": len(_indices_por_chat),
+            "bytes_em_uso": sum(_uso_por_chat.values()),
+            "orcamento_bytes": _ORCAMENTO_BYTES,
+        }
+
+
+def _descartar_da_memoria(chat_id: int):
     _indices_por_chat.pop(chat_id, None)
     _chunks_por_chat.pop(chat_id, None)
+    _lexicos_por_chat.pop(chat_id, None)
+    _indices_somente_leitura.discard(chat_id)
+    _uso_por_chat.pop(chat_id, None)
+
+
+def _registrar_uso(chat_id: int):
+    """Atualiza o tamanho estimado do chat e libera os menos usados se passar do orçamento."""
+    chunk_list = _chunks_por_chat.get(chat_id) or []
+    # Cada str em Python carrega ~50 bytes de overhead além do conteúdo
+    bytes_chunks = sum(len(chunk) + 50 for chunk in chunk_list)
+    lexico = _lexicos_por_chat.get(chat_id)
+    bytes_lexico = lexico.estimar_bytes() if lexico is not None else 0
+    _uso_por_chat[chat_id] = (
+        estimar_bytes(_indices_por_chat[chat_id]) + bytes_chunks + bytes_lexico
+    )
+    _uso_por_chat.move_to_end(chat_id)
+
+    total = sum(_uso_por_chat.values())
+    for candidato in list(_uso_por_chat):
+        if total <= _ORCAMENTO_BYTES:
+            break
+        if candidato == chat_id or candidato in _em_ingestao:
+            continue
+        total -= _uso_por_chat[candidato]
+        _descartar_da_memoria(candidato)
+        _estatisticas["evictions"] += 1
+
+
+def _gerar_embeddings(chunks: List[str]) -> np.ndarray:
+    """Calcula embeddings apenas dos chunks ausentes no cache em disco."""
+    vetores = _embedding_cache.obter(chunks)
+    faltando = [i for i, vetor in enumerate(vetores) if vetor is None]
+
+    if faltando:
+        textos = [chunks[i] for i in faltando]
+        novos = embeddings.encode(textos)
+        _embedding_cache.guardar(textos, novos)
+        for i, vetor in zip(faltando, novos):
+            vetores[i] = vetor
+
+    return np.vstack(vetores).astype("float32")
+
+
+def _vetores_em_cache(chunks: List[str]) -> Optional[np.ndarray]:
+    """Vetores originais dos chunks, se todos ainda estiverem no cache (migração sem perda)."""
+    vetores = _embedding_cache.obter(chunks)
+    if not vetores or any(vetor is None for vetor in vetores):
+        return None
+    return np.vstack(vetores).astype("float32")
+
+
+def _dir_chat(chat_id: int) -> Path:
+    return _INDEX_DIR / str(chat_id)
+
+
+def _indice_disponivel(chat_id: int) -> bool:
+    return chat_id in _indices_por_chat or (_dir_chat(chat_id) / _INDEX_FILE).exists()
+
+
+_EstadoChat = Tuple[Optional["faiss.Index"], Optional[List[str]], Optional[BM25Index]]
+
+
+def _obter_indice(chat_id: int) -> _EstadoChat:
+    """Retorna índice, chunks e BM25 do chat, abrindo-os do disco (mmap) na primeira consulta.
+
+    A leitura dos arquivos roda fora de `_lock`; só a instalação em memória fica
+    sob ele, e perde para outra thread que tenha instalado o chat nesse meio-tempo.
+    """
+    with _lock:
+        index = _indices_por_chat.get(chat_id)
+        if index is not None:
+            _estatisticas["hits"] += 1
+            if chat_id in _uso_por_chat:
+                _uso_por_chat.move_to_end(chat_id)
+            return index, _chunks_por_chat.get(chat_id), _lexicos_por_chat.get(chat_id)
+
+        _estatisticas["misses"] += 1
+        geracao = _geracoes.get(chat_id, 0)
+
+    carregado = _abrir_do_disco(chat_id, somente_leitura=True)
+    if carregado is None:
+        return None, None, None
+
+    with _lock:
+        index = _indices_por_chat.get(chat_id)
+        if index is not None:
+            return index, _chunks_por_chat.get(chat_id), _lexicos_por_chat.get(chat_id)
+        if _geracoes.get(chat_id, 0) != geracao:
+            return None, None, None  # chat excluído durante a leitura
+
+        index, chunk_list, lexico = carregado
+        _indices_por_chat[chat_id] = index
+        _chunks_por_chat[chat_id] = chunk_list
+        _lexicos_por_chat[chat_id] = lexico
+        _indices_somente_leitura.add(chat_id)
+        _registrar_uso(chat_id)
+        return index, chunk_list, lexico
+
+
+def _gravavel_em_memoria(chat_id: int) -> bool:
+    return chat_id in _indices_por_chat and chat_id not in _indices_somente_leitura
+
+
+def _obter_indice_gravavel(chat_id: int, do_disco: Optional[_EstadoChat] = None) -> _EstadoChat:
+    """Retorna o índice do chat pronto para receber novos vetores.
+
+    Sem uma cópia gravável em memória, usa `do_disco` (o resultado de
+    _abrir_do_disco lido fora do lock pelo chamador).
+    """
+    index = _indices_por_chat.get(chat_id)
+    if _gravavel_em_memoria(chat_id):
+        lexico = _lexicos_por_chat.get(chat_id)
+        chunk_list = _chunks_por_chat.get(chat_id, [])
+        if lexico is None:
+            lexico = BM25Index()
+            lexico.adicionar(chunk_list)
+        return index, chunk_list, lexico
+
+    _indices_somente_leitura.discard(chat_id)
+    if do_disco is None:
+        return None, None, None
+    return do_disco
+
+
+def _abrir_do_disco(chat_id: int, somente_leitura: bool):
+    pasta = _dir_chat(chat_id)
+    index_path = pasta / _INDEX_FILE
+    chunks_path = pasta / _CHUNKS_FILE
+    if not index_path.exists() or not chunks_path.exists():
+        return None
+
+    faiss = importar_faiss()
+    flags = 0
+    if somente_leitura:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    index = faiss.read_index(str(index_path), flags)
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        chunk_list = json.load(f)
+
+    # Os chunks são gravados antes do índice; descarta sobras de uma gravação interrompida
+    chunk_list = chunk_list[: index.ntotal]
+    return index, chunk_list, _abrir_lexico(pasta / _LEXICAL_FILE, chunk_list)
+
+
+def _abrir_lexico(caminho: Path, chunk_list: List[str]) -> BM25Index:
+    """Lê o BM25 salvo; se faltar ou estiver defasado (chats antigos), reconstrói dos chunks."""
+    if caminho.exists():
+        with open(caminho, "r", encoding="utf-8") as f:
+            lexico = BM25Index.de_dict(json.load(f))
+        if len(lexico) == len(chunk_list):
+            return lexico
+
+    lexico = BM25Index()
+    lexico.adicionar(chunk_list)
+    return lexico
+
+
+def _trava_gravacao(chat_id: int) -> threading.Lock:
+    with _lock:
+        return _locks_gravacao.setdefault(chat_id, threading.Lock())
+
+
+def _salvar_em_disco(chat_id: int):
+    """Grava chunks, BM25 e índice do chat de forma atômica (arquivo temporário + os.replace).
 
+    Só a cópia do estado em memória fica sob `_lock`; o JSON e a escrita rodam
+    fora dele, para não parar as buscas dos outros chats.
+    """
+    with _trava_gravacao(chat_id):
+        with _lock:
+            index = _indices_por_chat.get(chat_id)
+            if index is None:
+                return  # chat excluído antes da gravação
+            dados_index = importar_faiss().serialize_index(index)
+            chunk_list = list(_chunks_por_chat[chat_id])
+            lexico = _lexicos_por_chat[chat_id].para_dict()
 
-def _extrair_chunks(caminhos) -> List[str]:
-    textos: List[str] = []
+        pasta = _dir_chat(chat_id)
+        pasta.mkdir(parents=True, exist_ok=True)
 
-    for caminho in caminhos:
-        if caminho.endswith(".pdf"):
-            reader = PdfReader(caminho)
-            text = "\n".join(page.extract_text() or "" for page in reader.pages)
-            textos.append(text)
-        elif caminho.endswith(".txt"):
-            with open(caminho, "r", encoding="utf-8") as f:
-                textos.append(f.read())
-        elif caminho.endswith(".docx"):
-            doc = Document(caminho)
-            textos.append("\n".join(p.text for p in doc.paragraphs))
+        chunks_tmp = pasta / f"{_CHUNKS_FILE}.tmp"
+        with open(chunks_tmp, "w", encoding="utf-8") as f:
+            json.dump(chunk_list, f, ensure_ascii=False)
+        os.replace(chunks_tmp, pasta / _CHUNKS_FILE)
 
-    chunks: List[str] = []
-    for texto in textos:
-        partes = [p.strip() for p in texto.split(". ") if p.strip()]
-        chunks.extend(partes)
+        lexical_tmp = pasta / f"{_LEXICAL_FILE}.tmp"
+        with open(lexical_tmp, "w", encoding="utf-8") as f:
+            json.dump(lexico, f, ensure_ascii=False)
+        os.replace(lexical_tmp, pasta / _LEXICAL_FILE)
 
-    return chunks
+        index_tmp = pasta / f"{_INDEX_FILE}.tmp"
+        with open(index_tmp, "wb") as f:
+            dados_index.tofile(f)
+        os.replace(index_tmp, pasta / _INDEX_FILE)
@@ -1,7 +1,10 @@
 import os
+import threading
+from collections import OrderedDict
+from typing import Optional
 
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import ClientOptions, create_client, Client
 
 load_dotenv()
 
@@ -13,3 +16,35 @@ if not SUPABASE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Clientes que enviam o JWT de um usuário em cada requisição, sem tocar na sessão global
+_MAX_CLIENTES_POR_TOKEN = 64
+_clientes_por_token: "OrderedDict[str, Client]" = OrderedDict()
+_clientes_lock = threading.Lock()
+
+
+def client_for_token(access_token: Optional[str]) -> Client:
+    """Cliente para trabalho em segundo plano em nome do dono de `access_token`.
+
+    Sem token, devolve o cliente global.
+    """
+    if not access_token:
+        return supabase
+    with _clientes_lock:
+        cliente = _clientes_por_token.get(access_token)
+        if cliente is not None:
+            _clientes_por_token.move_to_end(access_token)
+            return cliente
+    cliente = create_client(
+        SUPABASE_URL,
+        SUPABASE_KEY,
+        options=ClientOptions(
+            headers={"Authorization": f"Bearer {access_token}"},
+            auto_refresh_token=False,
+            persist_session=False,
+        ),
+    )
+    with _clientes_lock:
+        _clientes_por_token[access_token] = cliente
+        while len(_clientes_por_token) > _MAX_CLIENTES_POR_TOKEN:
+            _clientes_por_token.popitem(last=False)
+    return cliente
@@ -0,0 +1,61 @@
+import hashlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Os módulos leem a configuração na importação: índices em pasta temporária e extração sem pool
+os.environ.setdefault("RAG_INDEX_DIR", tempfile.mkdtemp(prefix="rag_index_tests_"))
+os.environ.setdefault("RAG_EXTRACT_WORKERS", "1")
+os.environ.setdefault("MESSAGES_JOURNAL_DIR", tempfile.mkdtemp(prefix="write_behind_tests_"))
+# O cliente global é criado na importação, mas os testes trocam-no por um falso
+os.environ.setdefault("SUPABASE_KEY", "chave-de-teste")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _embedding_falso(textos):
+    """Saco de palavras com hash: determinístico e sem carregar modelo."""
+    import numpy as np
+
+    vetores = np.zeros((len(textos), 64), dtype="float32")
+    for i, texto in enumerate(textos):
+        for palavra in texto.lower().split():
+            posicao = int(hashlib.md5(palavra.encode("utf-8")).hexdigest(), 16) % 64
+            vetores[i, posicao] += 1.0
+        norma = np.linalg.norm(vetores[i]) or 1.0
+        vetores[i] /= norma
+    return vetores
+
+
+@pytest.fixture
+def rag_isolado(tmp_path, monkeypatch):
+    """Módulo rag com índices em `tmp_path` e embeddings falsos; limpa os chats ao final."""
+    pytest.importorskip("faiss")
+    import rag
+
+    monkeypatch.setattr(rag, "_INDEX_DIR", tmp_path / "indices")
+    monkeypatch.setattr(rag, "_gerar_embeddings", _embedding_falso)
+    monkeypatch.setattr(rag.embeddings, "encode_consultas", _embedding_falso)
+    yield rag
+    rag.definir_fonte_arquivos(None)
+    for chat_id in list(rag._indices_por_chat):
+        rag.limpar_chat_contexto(chat_id)
+
+
+@pytest.fixture
+def supabase_falso(monkeypatch):
+    """database (e o cliente por token) apontando para um Supabase em memória."""
+    pytest.importorskip("supabase")
+    import database
+    from supabase_falso import SupabaseFalso
+
+    falso = SupabaseFalso()
+    monkeypatch.setattr(database, "supabase", falso)
+    monkeypatch.setattr(database, "client_for_token", lambda _token: falso)
+    database._invalidar_chats()
+    yield falso
+    database._invalidar_chats()
+    with database._exclusoes_lock:
+        database._exclusoes.clear()
@@ -0,0 +1,153 @@
+"""Cliente Supabase em memória com o subconjunto de postgrest/storage3 que o app usa."""
+
+import itertools
+import threading
+
+from storage3.exceptions import StorageApiError
+
+
+class _Resposta:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Consulta:
+    def __init__(self, banco, tabela):
+        self.banco = banco
+        self.tabela = tabela
+        self.acao = "select"
+        self.valores = None
+        self.filtros = []
+        self.ordem = None
+        self.limite = None
+
+    def select(self, *_colunas):
+        self.acao = "select"
+        return self
+
+    def insert(self, valores):
+        self.acao, self.valores = "insert", valores
+        return self
+
+    def update(self, valores):
+        self.acao, self.valores = "update", valores
+        return self
+
+    def delete(self):
+        self.acao = "delete"
+        return self
+
+    def eq(self, coluna, valor):
+        self.filtros.append(lambda linha: linha.get(coluna) == valor)
+        return self
+
+    def neq(self, coluna, valor):
+        self.filtros.append(lambda linha: linha.get(coluna) != valor)
+        return self
+
+    def lt(self, coluna, valor):
+        self.filtros.append(lambda linha: linha.get(coluna) < valor)
+        return self
+
+    def gt(self, coluna, valor):
+        self.filtros.append(lambda linha: linha.get(coluna) > valor)
+        return self
+
+    def in_(self, coluna, valores):
+        valores = list(valores)
+        self.filtros.append(lambda linha: linha.get(coluna) in valores)
+        return self
+
+    def order(self, coluna, desc=False):
+        self.ordem = (coluna, desc)
+        return self
+
+    def limit(self, n):
+        self.limite = n
+        return self
+
+    def _seleciona(self, linha):
+        return all(filtro(linha) for filtro in self.filtros)
+
+    def execute(self):
+        with self.banco.lock:
+            if self.banco.ao_executar is not None:
+                self.banco.ao_executar(self)
+            linhas = self.banco.tabelas.setdefault(self.tabela, [])
+            if self.acao == "insert":
+                novas = self.valores if isinstance(self.valores, list) else [self.valores]
+                novas = [{"id": next(self.banco.ids), **linha} for linha in novas]
+                linhas.extend(novas)
+                return _Resposta(novas)
+            if self.acao == "delete":
+                removidas = [linha for linha in linhas if self._seleciona(linha)]
+                linhas[:] = [linha for linha in linhas if not self._seleciona(linha)]
+                return _Resposta(removidas)
+            if self.acao == "update":
+                alteradas = [linha for linha in linhas if self._seleciona(linha)]
+                for linha in alteradas:
+                    linha.update(self.valores)
+                return _Resposta(alteradas)
+            resultado = [dict(linha) for linha in linhas if self._seleciona(linha)]
+            if self.ordem is not None:
+                coluna, desc = self.ordem
+                resultado.sort(key=lambda linha: linha.get(coluna), reverse=desc)
+            if self.limite is not None:
+                resultado = resultado[:self.limite]
+            return _Resposta(resultado)
+
+
+class _Bucket:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def upload(self, caminho, dados, _opcoes=None):
+        if not isinstance(dados, bytes):
+            dados = dados.read()
+        with self.storage.lock:
+            if caminho in self.storage.objetos:
+                raise StorageApiError("The resource already exists", "Duplicate", 409)
+            self.storage.objetos[caminho] = dados
+            self.storage.uploads.append(caminho)
+        return {"path": caminho}
+
+    def remove(self, caminhos):
+        with self.storage.lock:
+            if self.storage.antes_de_remover is not None:
+                self.storage.antes_de_remover(list(caminhos))
+            for caminho in caminhos:
+                self.storage.objetos.pop(caminho, None)
+        return []
+
+    def exists(self, caminho):
+        with self.storage.lock:
+            return caminho in self.storage.objetos
+
+    def download(self, caminho):
+        with self.storage.lock:
+            return self.storage.objetos[caminho]
+
+
+class _Storage:
+    def __init__(self):
+        self.objetos = {}
+        self.uploads = []
+        self.antes_de_remover = None
+        self.lock = threading.RLock()
+
+    def from_(self, _bucket):
+        return _Bucket(self)
+
+
+class SupabaseFalso:
+    """`tabelas` guarda as linhas por tabela; `ao_executar(consulta)` permite injetar falhas."""
+
+    def __init__(self):
+        self.tabelas = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.RLock()
+        self.ao_executar = None
+        self.storage = _Storage()
+
+    def table(self, nome):
+        return _Consulta(self, nome)
@@ -0,0 +1,87 @@
+"""Sessão: renovação única por refresh token e tokens antigos de gravações em fila."""
+
+import base64
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("supabase")
+
+import auth  # noqa: E402
+
+
+def _jwt(sub, expira_em, marca=""):
+    def _b64(dados):
+        return base64.urlsafe_b64encode(json.dumps(dados).encode()).rstrip(b"=").decode()
+
+    claims = {"sub": sub, "exp": int(time.time() + expira_em), "marca": marca}
+    return f"{_b64({'alg': 'none'})}.{_b64(claims)}.assinatura"
+
+
+class AuthFalso:
+    def __init__(self):
+        self.sessoes = []
+        self.renovacoes = []
+
+    def set_session(self, access, refresh):
+        self.sessoes.append((access, refresh))
+
+    def refresh_session(self, refresh):
+        self.renovacoes.append(refresh)
+        n = len(self.renovacoes)
+        sessao = SimpleNamespace(access_token=_jwt("u1", 3600, f"r{n}"), refresh_token=f"refresh-{n}")
+        return SimpleNamespace(session=sessao)
+
+
+@pytest.fixture
+def cliente_auth(monkeypatch):
+    falso = AuthFalso()
+    monkeypatch.setattr(auth, "supabase", SimpleNamespace(auth=falso))
+    monkeypatch.setattr(auth, "_applied", None)
+    monkeypatch.setattr(auth, "_refreshed", {})
+    monkeypatch.setattr(auth, "_renewed_access", {})
+    monkeypatch.setattr(auth, "_latest_by_user", {})
+    return falso
+
+
+def test_sessao_valida_e_aplicada_uma_vez(cliente_auth):
+    token = _jwt("u1", 3600)
+
+    assert auth.ensure_session(token, "refresh-0") == (token, "refresh-0")
+    assert auth.ensure_session(token, "refresh-0") == (token, "refresh-0")
+
+    assert cliente_auth.sessoes == [(token, "refresh-0")]
+    assert cliente_auth.renovacoes == []
+
+
+def test_refresh_token_e_usado_uma_unica_vez(cliente_auth):
+    velho = _jwt("u1", 10)
+
+    primeiro = auth.ensure_session(velho, "refresh-0")
+    # Outra aba (ou gravação em fila) ainda com o par antigo
+    segundo = auth.ensure_session(velho, "refresh-0")
+
+    assert primeiro == segundo
+    assert cliente_auth.renovacoes == ["refresh-0"]
+    assert auth.current_access_token(velho) == primeiro[0]
+
+
+def test_falha_na_renovacao_propaga(cliente_auth, monkeypatch):
+    monkeypatch.setattr(cliente_auth, "refresh_session", lambda _r: SimpleNamespace(session=None))
+
+    with pytest.raises(RuntimeError):
+        auth.ensure_session(_jwt("u1", 10), "refresh-0")
+
+
+def test_token_expirado_de_journal_usa_sessao_atual_do_usuario(cliente_auth):
+    # Token gravado antes de um reinício: este processo nunca o renovou
+    do_journal = _jwt("u1", -600, "antigo")
+    assert auth.current_access_token(do_journal) == do_journal
+
+    novo = _jwt("u1", 3600, "novo")
+    auth.set_session(novo, "refresh-novo")
+
+    assert auth.current_access_token(do_journal) == novo
+    assert auth.current_access_token(_jwt("u2", -600)) != novo
@@ -0,0 +1,39 @@
+"""Busca híbrida: o BM25 só resgata trechos sem similaridade vetorial por identificadores."""
+
+import pytest
+
+pytest.importorskip("faiss")
+
+from lexical_index import BM25Index, eh_identificador  # noqa: E402
+
+
+@pytest.fixture
+def chat_com_contratos(rag_isolado, tmp_path):
+    paragrafos = ["Qual o valor da multa por atraso no pagamento?"] + [
+        f"O contrato ABC-{i} vence em 12/20{i:02d} conforme a cláusula {i}." for i in range(30)
+    ]
+    caminho = tmp_path / "contratos.txt"
+    caminho.write_text("\n\n".join(paragrafo * 20 for paragrafo in paragrafos), encoding="utf-8")
+    rag_isolado.carregar_arquivos([str(caminho)], 3)
+    return rag_isolado
+
+
+def test_palavra_comum_nao_resgata_trecho_sem_similaridade(chat_com_contratos):
+    # "qual" é raro no chat (IDF alto), mas não identifica nada
+    assert chat_com_contratos.buscar_contexto("Qual é a capital da França?", 3) == []
+
+
+def test_identificador_resgata_trecho_pelo_bm25(chat_com_contratos):
+    trechos = chat_com_contratos.buscar_contexto("o que diz o ABC-7?", 3)
+
+    assert trechos
+    assert all("ABC-7 " in trecho for trecho in trechos)
+
+
+def test_com_identificadores_ignora_termos_comuns():
+    lexico = BM25Index()
+    lexico.adicionar(["qual o prazo", "versão v1.2 de 12/2024", "pedido 123"])
+
+    assert lexico.com_identificadores("qual a versão de 12/2024?") == {1}
+    assert lexico.com_identificadores("qual o pedido 123") == {2}
+    assert eh_identificador("abc-123") and not eh_identificador("qual")
@@ -0,0 +1,20 @@
+"""Chunks com orçamento de tokens e validação dos parâmetros."""
+
+import pytest
+
+from chunking import contar_tokens, fatiar
+
+
+def test_chunks_respeitam_o_orcamento():
+    paragrafos = [" ".join(f"palavra{i}" for i in range(300)), None, "Curto."]
+
+    chunks = list(fatiar(paragrafos, max_tokens=50, sobreposicao=10))
+
+    assert chunks[-1] == "Curto."
+    assert all(contar_tokens(chunk) <= 50 for chunk in chunks)
+
+
+@pytest.mark.parametrize("max_tokens, sobreposicao", [(50, 50), (50, 80), (50, -1), (0, 0)])
+def test_parametros_invalidos_falham_na_chamada(max_tokens, sobreposicao):
+    with pytest.raises(ValueError):
+        fatiar(["texto"], max_tokens=max_tokens, sobreposicao=sobreposicao)
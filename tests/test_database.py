@@ -0,0 +1,121 @@
+"""database contra um Supabase em memória: listagem, deduplicação e exclusão."""
+
+import datetime
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("supabase")
+
+import database  # noqa: E402
+
+
+def _criar_chats(falso, user_id, n):
+    inicio = datetime.datetime(2026, 1, 1)
+    falso.tabelas["chats"] = [
+        {
+            "id": i + 1,
+            "user_id": user_id,
+            "title": f"Chat {i + 1}",
+            "created_at": (inicio + datetime.timedelta(minutes=i)).isoformat(),
+        }
+        for i in range(n)
+    ]
+
+
+def _marcar_exclusao_pendente(monkeypatch, chat_id):
+    # A exclusão fica "pendente": o job não roda
+    monkeypatch.setattr(database._executor_exclusoes, "submit", lambda *_args: Future())
+    database.deletar_chat(chat_id)
+
+
+def test_pagina_com_exclusao_pendente_nao_parece_a_ultima(supabase_falso, monkeypatch):
+    _criar_chats(supabase_falso, "u1", 45)
+    _marcar_exclusao_pendente(monkeypatch, 40)
+
+    crua = database.listar_chats("u1", limite=30, incluir_excluidos=True)
+    visivel = database.listar_chats("u1", limite=30)
+
+    assert len(crua) == 30
+    assert len(visivel) == 29
+    assert database.sem_excluidos(crua) == visivel
+    seguinte = database.listar_chats("u1", limite=30, antes_de=crua[-1]["created_at"])
+    assert len(seguinte) == 15
+
+
+def test_objeto_ja_existe_reconhece_o_erro_do_storage3():
+    from storage3.exceptions import StorageApiError
+
+    assert database._objeto_ja_existe(StorageApiError("The resource already exists", "Duplicate", 409))
+    assert database._objeto_ja_existe(StorageApiError("exists", "Duplicate", "409"))
+    assert not database._objeto_ja_existe(StorageApiError("Bucket not found", "NoSuchBucket", 404))
+    assert not database._objeto_ja_existe(RuntimeError("409"))
+
+
+def _arquivo_local(tmp_path, nome, conteudo):
+    caminho = tmp_path / nome
+    caminho.write_bytes(conteudo)
+    return str(caminho)
+
+
+def test_upload_deduplicado_recria_objeto_removido_por_exclusao_concorrente(supabase_falso, tmp_path):
+    origem = _arquivo_local(tmp_path, "a.txt", b"mesmo conteudo")
+    assert database.salvar_arquivos(1, [("a.txt", "1/a.txt", origem)], user_id="u1") == [None]
+    destino = supabase_falso.tabelas["files"][0]["path"]
+
+    # A exclusão do chat 1 remove o objeto logo depois de o novo upload ver a linha antiga
+    def _remover_no_insert(consulta):
+        if consulta.tabela == "files" and consulta.acao == "insert":
+            supabase_falso.storage.objetos.pop(destino, None)
+
+    supabase_falso.ao_executar = _remover_no_insert
+    assert database.salvar_arquivos(2, [("b.txt", "2/b.txt", origem)], user_id="u1") == [None]
+
+    assert supabase_falso.storage.objetos[destino] == b"mesmo conteudo"
+
+
+def test_exclusao_confere_referencias_antes_de_remover(supabase_falso, tmp_path):
+    origem = _arquivo_local(tmp_path, "a.txt", b"compartilhado")
+    database.salvar_arquivos(1, [("a.txt", "1/a.txt", origem)], user_id="u1")
+    destino = supabase_falso.tabelas["files"][0]["path"]
+    selects_em_files = []
+
+    # Consultas em files: listagem do chat, checagem de referências e a reconferência.
+    # Outro chat passa a referenciar o objeto logo antes da reconferência.
+    def _nova_referencia(consulta):
+        if consulta.tabela == "files" and consulta.acao == "select":
+            selects_em_files.append(consulta)
+            if len(selects_em_files) == 3:
+                supabase_falso.tabelas["files"].append({"id": 99, "chat_id": 2, "path": destino})
+
+    supabase_falso.ao_executar = _nova_referencia
+    database.deletar_chat(1, em_segundo_plano=False)
+
+    assert len(selects_em_files) == 3
+    assert destino in supabase_falso.storage.objetos
+    assert [linha["chat_id"] for linha in supabase_falso.tabelas["files"]] == [2]
+
+
+def test_exclusao_remove_objeto_orfao(supabase_falso, tmp_path):
+    origem = _arquivo_local(tmp_path, "a.txt", b"so deste chat")
+    database.salvar_arquivos(1, [("a.txt", "1/a.txt", origem)], user_id="u1")
+
+    database.deletar_chat(1, em_segundo_plano=False)
+
+    assert supabase_falso.storage.objetos == {}
+    assert supabase_falso.tabelas["files"] == []
+    assert database.status_exclusao(1)["estado"] == "concluida"
+
+
+def test_mensagem_com_sessao_expirada_nao_e_enviada(supabase_falso, monkeypatch):
+    monkeypatch.setattr(database, "current_access_token", lambda token: token)
+    monkeypatch.setattr(database, "token_expires_in", lambda _token: -60.0)
+
+    with pytest.raises(database.SessaoExpirada):
+        database._inserir_mensagens([{"chat_id": 1, "content": "oi"}], "token-antigo")
+    assert supabase_falso.tabelas.get("messages", []) == []
+
+
+def test_estado_mensagem_ignora_resultado_sem_fila():
+    # Sem write-behind, salvar_mensagem retorna a resposta do insert, não um id
+    assert database.estado_mensagem(object()) is None
@@ -0,0 +1,79 @@
+"""Extração paralela: ordem determinística e tarefas em andamento limitadas."""
+
+from concurrent.futures import Future
+
+import extraction
+
+
+class PoolSincrono:
+    """Executa cada tarefa na hora e registra o que foi submetido."""
+
+    def __init__(self):
+        self.submetidas = []
+
+    def submit(self, fn, *args):
+        futuro = Future()
+        futuro.set_result(fn(*args))
+        self.submetidas.append(args)
+        return futuro
+
+
+def _arquivos(pasta, n):
+    caminhos = []
+    for i in range(n):
+        caminho = pasta / f"doc{i}.txt"
+        caminho.write_text(f"Documento {i}, primeiro parágrafo.\n\nDocumento {i}, fim.", encoding="utf-8")
+        caminhos.append(str(caminho))
+    return caminhos
+
+
+def test_ordem_igual_a_extracao_sequencial(tmp_path, monkeypatch):
+    caminhos = _arquivos(tmp_path, 7)
+    monkeypatch.setattr(extraction, "_MAX_WORKERS", 1)
+    esperado = list(extraction.iterar_chunks(caminhos))
+
+    pool = PoolSincrono()
+    monkeypatch.setattr(extraction, "_MAX_WORKERS", 3)
+    monkeypatch.setattr(extraction, "_obter_pool", lambda: pool)
+
+    assert list(extraction.iterar_chunks(caminhos)) == esperado
+    assert len(pool.submetidas) == 7
+
+
+def test_no_maximo_max_workers_tarefas_em_andamento(tmp_path, monkeypatch):
+    caminhos = _arquivos(tmp_path, 10)
+    pool = PoolSincrono()
+    monkeypatch.setattr(extraction, "_MAX_WORKERS", 3)
+    monkeypatch.setattr(extraction, "_obter_pool", lambda: pool)
+
+    chunks = extraction.iterar_chunks(caminhos)
+    primeiro = next(chunks)
+
+    assert "Documento 0" in primeiro
+    # Consumir o primeiro resultado libera uma vaga: 3 em andamento + 1 entregue
+    assert len(pool.submetidas) == 4
+    chunks.close()
+
+
+def test_paragrafos_txt_separados_por_linhas_em_branco(tmp_path):
+    caminho = tmp_path / "doc.txt"
+    caminho.write_text("Primeira linha\nsegunda linha\n\n  \n  Recuado\n\nFim sem quebra", encoding="utf-8")
+
+    assert list(extraction.iterar_paragrafos(str(caminho))) == [
+        "Primeira linha\nsegunda linha\n",
+        "  Recuado\n",
+        "Fim sem quebra",
+    ]
+
+
+def test_arquivo_sem_quebras_e_lido_em_partes(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction, "_TXT_BLOCO", 100)
+    texto = "".join(f"palavra{i} " for i in range(200))
+    caminho = tmp_path / "uma_linha.txt"
+    caminho.write_text(texto, encoding="utf-8")
+
+    partes = list(extraction.iterar_paragrafos(str(caminho)))
+
+    assert "".join(partes) == texto
+    assert len(partes) > 1
+    assert max(len(parte) for parte in partes) < 2 * 100
@@ -0,0 +1,50 @@
+"""Busca restrita aos candidatos do pré-filtro, para cada tipo de índice."""
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+import index_manager  # noqa: E402
+
+_DIM = 32
+
+
+def _vetores(n, semente=0):
+    return np.random.default_rng(semente).standard_normal((n, _DIM)).astype("float32")
+
+
+def _esperado(vetores, consulta, ids, k, cosseno):
+    if cosseno:
+        vetores = vetores / np.linalg.norm(vetores, axis=1, keepdims=True)
+        consulta = consulta / np.linalg.norm(consulta)
+    distancias = ((vetores[ids] - consulta) ** 2).sum(axis=1)
+    return ids[np.argsort(distancias, kind="stable")[:k]]
+
+
+@pytest.mark.parametrize(
+    "descricao, metrica",
+    [
+        ("Flat", faiss.METRIC_L2),
+        ("HNSW16", faiss.METRIC_L2),
+        ("IVF16,Flat", faiss.METRIC_L2),
+        ("HNSW16_SQ8", faiss.METRIC_INNER_PRODUCT),
+        ("IVF16,SQ8", faiss.METRIC_INNER_PRODUCT),
+    ],
+)
+def test_candidatos_pontuados_em_todos_os_tipos(descricao, metrica):
+    vetores = _vetores(2000)
+    index = index_manager.construir(descricao, vetores, metrica)
+    consulta = _vetores(1, semente=1)
+    candidatos = np.random.default_rng(2).choice(len(vetores), 40, replace=False)
+
+    distancias, indices = index_manager.buscar_restrito(index, consulta, 5, candidatos)
+
+    assert indices.shape == (1, 5)
+    assert set(indices[0]) <= set(candidatos)
+    assert np.all(np.diff(distancias[0]) >= 0)
+    cosseno = metrica == faiss.METRIC_INNER_PRODUCT
+    esperado = _esperado(vetores, consulta[0], candidatos, 5, cosseno)
+    # Índices comprimidos decodificam com perda: basta a maioria dos vizinhos exatos
+    minimo = 5 if descricao in ("Flat", "HNSW16", "IVF16,Flat") else 4
+    assert len(set(indices[0]) & set(esperado)) >= minimo
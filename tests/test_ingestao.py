@@ -0,0 +1,129 @@
+"""Ingestão de arquivos: migração do índice sem bloquear as buscas."""
+
+import threading
+
+import pytest
+
+pytest.importorskip("faiss")
+
+import index_manager  # noqa: E402
+
+
+def _escrever_paragrafos(pasta, n):
+    caminho = pasta / "doc.txt"
+    caminho.write_text(
+        "\n\n".join(f"Parágrafo {i} sobre o assunto número {i}." for i in range(n)),
+        encoding="utf-8",
+    )
+    return str(caminho)
+
+
+def _lock_livre(rag):
+    """Se outra thread consegue pegar `_lock` agora."""
+    resultado = []
+
+    def _tentar():
+        if rag._lock.acquire(blocking=False):
+            rag._lock.release()
+            resultado.append(True)
+        else:
+            resultado.append(False)
+
+    verificar = threading.Thread(target=_tentar)
+    verificar.start()
+    verificar.join()
+    return resultado[0]
+
+
+def test_gravacao_e_leitura_do_disco_fora_do_lock(rag_isolado, tmp_path, monkeypatch):
+    rag = rag_isolado
+    lock_livre = []
+    dump_original = rag.json.dump
+    load_original = rag.json.load
+
+    def _dump(*args, **kwargs):
+        lock_livre.append(("dump", _lock_livre(rag)))
+        return dump_original(*args, **kwargs)
+
+    def _load(*args, **kwargs):
+        lock_livre.append(("load", _lock_livre(rag)))
+        return load_original(*args, **kwargs)
+
+    monkeypatch.setattr(rag.json, "dump", _dump)
+    monkeypatch.setattr(rag.json, "load", _load)
+
+    rag.carregar_arquivos([_escrever_paragrafos(tmp_path, 5)], 8)
+    with rag._lock:
+        rag._descartar_da_memoria(8)
+    trechos = rag.buscar_contexto("Parágrafo 3 sobre o assunto número 3.", 8)
+
+    assert any("número 3." in trecho for trecho in trechos)
+    assert {operacao for operacao, _ in lock_livre} == {"dump", "load"}
+    assert all(livre for _, livre in lock_livre)
+
+
+def test_chat_excluido_durante_a_leitura_nao_volta(rag_isolado, tmp_path, monkeypatch):
+    rag = rag_isolado
+    rag.carregar_arquivos([_escrever_paragrafos(tmp_path, 5)], 9)
+    with rag._lock:
+        rag._descartar_da_memoria(9)
+    abrir_original = rag._abrir_do_disco
+
+    def _abrir_e_excluir(chat_id, somente_leitura):
+        carregado = abrir_original(chat_id, somente_leitura)
+        rag.limpar_chat_contexto(chat_id)
+        return carregado
+
+    monkeypatch.setattr(rag, "_abrir_do_disco", _abrir_e_excluir)
+
+    assert rag.buscar_contexto("Parágrafo 3", 9) == []
+    assert 9 not in rag._indices_por_chat
+
+
+def test_migracao_monta_o_indice_fora_do_lock(rag_isolado, tmp_path, monkeypatch):
+    rag = rag_isolado
+    monkeypatch.setattr(index_manager, "LIMITE_MIGRACAO", 2)
+    monkeypatch.setattr(index_manager, "TIPO_APROXIMADO", "hnsw")
+    montagem_com_lock_livre = []
+    construir_original = index_manager.construir
+
+    def _construir(*args, **kwargs):
+        montagem_com_lock_livre.append(_lock_livre(rag))
+        return construir_original(*args, **kwargs)
+
+    monkeypatch.setattr(index_manager, "construir", _construir)
+
+    total = rag.carregar_arquivos([_escrever_paragrafos(tmp_path, 40)], 7)
+
+    assert total >= 2
+    assert montagem_com_lock_livre == [True]
+    assert index_manager.tipo_do_indice(rag._indices_por_chat[7]) == "hnsw"
+    assert rag._indices_por_chat[7].ntotal == len(rag._chunks_por_chat[7])
+
+
+def test_ingestoes_sobrepostas_mantem_o_chat_protegido(rag_isolado, tmp_path, monkeypatch):
+    rag = rag_isolado
+    gerando = threading.Event()
+    liberar = threading.Event()
+    gerar_original = rag._gerar_embeddings
+
+    def _gerar(chunks):
+        if any("lento" in chunk for chunk in chunks):
+            gerando.set()
+            liberar.wait(5)
+        return gerar_original(chunks)
+
+    monkeypatch.setattr(rag, "_gerar_embeddings", _gerar)
+    lento = tmp_path / "lento.txt"
+    lento.write_text("Arquivo lento de propósito.", encoding="utf-8")
+    primeira = threading.Thread(target=rag.carregar_arquivos, args=([str(lento)], 5))
+    primeira.start()
+    try:
+        assert gerando.wait(5)
+        rag.carregar_arquivos([_escrever_paragrafos(tmp_path, 3)], 5)
+        # A segunda terminou, mas a primeira ainda ingere: o chat não pode sair da memória
+        assert rag._em_ingestao.get(5) == 1
+    finally:
+        liberar.set()
+        primeira.join(5)
+    assert 5 not in rag._em_ingestao
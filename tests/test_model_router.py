@@ -0,0 +1,110 @@
+"""Fallback entre modelos: circuit breaker, hedge e erro agregado."""
+
+import threading
+import time
+
+import pytest
+
+import model_router
+from model_router import CircuitBreaker, FalhaNosModelos, executar_com_fallback
+
+
+@pytest.fixture(autouse=True)
+def registro_limpo(monkeypatch):
+    # Breakers e latências são globais por nome de modelo
+    monkeypatch.setattr(model_router, "_breakers", {})
+    monkeypatch.setattr(model_router, "_latencias", {})
+    monkeypatch.setattr(model_router, "HEDGE_ATRASO_PADRAO", 0.05)
+
+
+def test_breaker_abre_apos_falhas_seguidas_e_testa_uma_vez(monkeypatch):
+    agora = [100.0]
+    monkeypatch.setattr(model_router.time, "monotonic", lambda: agora[0])
+    breaker = CircuitBreaker(falhas_para_abrir=2, espera=10)
+
+    breaker.registrar_falha()
+    assert breaker.estado == "fechado"
+    breaker.registrar_falha()
+    assert breaker.estado == "aberto"
+    assert not breaker.permite()
+
+    agora[0] += 10
+    assert breaker.estado == "meio-aberto"
+    assert breaker.permite()
+    # Só uma tentativa por vez no meio-aberto
+    assert not breaker.permite()
+
+    breaker.registrar_sucesso()
+    assert breaker.estado == "fechado"
+    assert breaker.falhas_seguidas == 0
+
+
+def test_falha_no_meio_aberto_reabre(monkeypatch):
+    agora = [0.0]
+    monkeypatch.setattr(model_router.time, "monotonic", lambda: agora[0])
+    breaker = CircuitBreaker(falhas_para_abrir=1, espera=5)
+    breaker.registrar_falha()
+
+    agora[0] += 5
+    assert breaker.permite()
+    breaker.registrar_falha()
+
+    assert breaker.estado == "aberto"
+    agora[0] += 4
+    assert not breaker.permite()
+
+
+def test_fallback_para_o_proximo_modelo():
+    def _chamada(modelo, _prazo):
+        if modelo == "a":
+            raise TimeoutError("sem resposta")
+        return f"resposta de {modelo}"
+
+    assert executar_com_fallback(["a", "b"], _chamada) == "resposta de b"
+    assert model_router.estado_modelos()["a"]["falhas"] == 1
+
+
+def test_modelo_com_breaker_aberto_e_pulado():
+    chamados = []
+    for _ in range(model_router.BREAKER_FALHAS):
+        model_router._breaker("a").registrar_falha()
+
+    def _chamada(modelo, _prazo):
+        chamados.append(modelo)
+        return modelo
+
+    assert executar_com_fallback(["a", "b"], _chamada) == "b"
+    assert chamados == ["b"]
+
+
+def test_hedge_dispara_o_proximo_e_descarta_o_perdedor():
+    liberar = threading.Event()
+    descartados = []
+
+    def _chamada(modelo, _prazo):
+        if modelo == "lento":
+            liberar.wait(5)
+        return modelo
+
+    inicio = time.monotonic()
+    resultado = executar_com_fallback(["lento", "rapido"], _chamada, descartar=descartados.append)
+
+    assert resultado == "rapido"
+    assert time.monotonic() - inicio < 2
+    liberar.set()
+    for _ in range(100):
+        if descartados:
+            break
+        time.sleep(0.01)
+    assert descartados == ["lento"]
+
+
+def test_sem_modelo_disponivel_agrega_os_erros():
+    def _chamada(modelo, _prazo):
+        raise ValueError(f"falhou {modelo}")
+
+    with pytest.raises(FalhaNosModelos) as info:
+        executar_com_fallback(["a", "b"], _chamada)
+
+    assert [modelo for modelo, _erro in info.value.erros] == ["a", "b"]
+    assert "falhou b" in str(info.value)
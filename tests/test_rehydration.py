@@ -0,0 +1,85 @@
+"""Reidratação de índices a partir de um Storage local (substituto do bucket uploads)."""
+
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip("faiss")
+
+import rag  # noqa: E402
+
+
+class StorageLocal:
+    """Arquivos de cada chat numa pasta, no formato que listar_arquivos/baixar_arquivo entregam."""
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self.arquivos = {}
+        self.tokens = []
+        self.listagens = 0
+
+    def adicionar(self, chat_id, nome, conteudo, caminho=None):
+        caminho = caminho or f"{chat_id}/{nome}"
+        destino = os.path.join(self.pasta, caminho)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with open(destino, "w", encoding="utf-8") as f:
+            f.write(conteudo)
+        self.arquivos.setdefault(chat_id, []).append((nome, caminho))
+
+    def listar(self, chat_id, access_token=None):
+        self.listagens += 1
+        self.tokens.append(access_token)
+        return list(self.arquivos.get(chat_id, []))
+
+    def baixar(self, caminho, destino, access_token=None):
+        self.tokens.append(access_token)
+        shutil.copyfile(os.path.join(self.pasta, caminho), destino)
+
+
+@pytest.fixture
+def storage(rag_isolado, tmp_path):
+    local = StorageLocal(str(tmp_path / "bucket"))
+    rag.definir_fonte_arquivos(local.listar, local.baixar)
+    return local
+
+
+def test_busca_reconstroi_chat_sem_indice_local(storage):
+    storage.adicionar(1, "contrato.txt", "O prazo de entrega do contrato é de trinta dias corridos.")
+
+    trechos = rag.buscar_contexto("qual o prazo de entrega do contrato?", 1)
+
+    assert any("trinta dias" in trecho for trecho in trechos)
+    assert (rag._dir_chat(1) / "index.faiss").exists()
+
+
+def test_reidratacao_usa_token_do_dono(storage):
+    storage.adicionar(2, "a.txt", "Relatório anual de vendas da filial sul.")
+
+    rag.pre_carregar_em_segundo_plano([2], "token-do-usuario").result(timeout=30)
+
+    assert storage.tokens and set(storage.tokens) == {"token-do-usuario"}
+    assert rag.reidratar_chat(2, "token-do-usuario") == 0  # índice já existe
+
+
+def test_objeto_compartilhado_e_baixado_uma_vez(storage):
+    storage.adicionar(3, "manual.txt", "Manual de instalação do equipamento.", caminho="blobs/u/ab/abc")
+    storage.arquivos[3].append(("manual-copia.txt", "blobs/u/ab/abc"))
+
+    assert rag.reidratar_chat(3) == 1
+    assert len(rag._chunks_por_chat[3]) == 1
+
+
+def test_chat_sem_arquivos_nao_e_listado_a_cada_pergunta(storage):
+    assert rag.buscar_contexto("alguma coisa", 4) == []
+    assert rag.buscar_contexto("outra coisa", 4) == []
+
+    assert storage.listagens == 1
+
+
+def test_sem_fonte_registrada_nao_reidrata(storage):
+    storage.adicionar(5, "x.txt", "conteúdo qualquer")
+    rag.definir_fonte_arquivos(None)
+
+    assert rag.buscar_contexto("conteúdo", 5) == []
+    assert storage.listagens == 0
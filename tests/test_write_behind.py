@@ -0,0 +1,217 @@
+"""Fila write-behind com um `inserir_lote` falso: lotes, falhas, journal e travas."""
+
+import json
+import os
+import threading
+
+import pytest
+
+import write_behind
+from write_behind import SessaoExpirada, WriteBehindQueue, sessao_expirada
+
+
+@pytest.fixture
+def criar_fila(tmp_path):
+    filas = []
+
+    def _criar(inserir_lote, **kwargs):
+        kwargs.setdefault("intervalo", 3600)  # flush só quando o teste pede
+        kwargs.setdefault("fsync", False)
+        fila = WriteBehindQueue(inserir_lote, str(tmp_path), "messages", **kwargs)
+        filas.append(fila)
+        return fila
+
+    yield _criar
+    for fila in filas:
+        fila.encerrar()
+
+
+def test_descartar_espera_o_lote_em_envio(criar_fila):
+    enviando = threading.Event()
+    liberar = threading.Event()
+    entregues = []
+
+    def _inserir(linhas, _sessao):
+        enviando.set()
+        liberar.wait(5)
+        entregues.extend(linhas)
+
+    fila = criar_fila(_inserir)
+    fila.enfileirar({"chat_id": 1, "n": 1}, "t")
+    flush = threading.Thread(target=fila.flush)
+    flush.start()
+    assert enviando.wait(5)
+
+    descartou = []
+    descarte = threading.Thread(
+        target=lambda: descartou.append(fila.descartar(lambda p: p["chat_id"] == 1))
+    )
+    descarte.start()
+    descarte.join(0.2)
+    # Enquanto o lote está no ar, descartar() não retorna
+    assert descarte.is_alive()
+
+    liberar.set()
+    flush.join(5)
+    descarte.join(5)
+    assert descartou == [0]
+    assert [linha["n"] for linha in entregues] == [1]
+
+
+class ErroServidor(Exception):
+    """Erro com `code` Postgres/PostgREST, como o APIError do postgrest."""
+
+    def __init__(self, code):
+        super().__init__(f"erro {code}")
+        self.code = code
+
+
+@pytest.fixture
+def sem_espera(monkeypatch):
+    # Backoff zerado: o próximo flush já tenta de novo
+    monkeypatch.setattr(write_behind, "_ESPERA_MAX", 0.0)
+
+
+def test_lote_recusado_e_dividido_ate_isolar_a_linha_ruim(criar_fila):
+    chamadas = []
+    entregues = []
+
+    def _inserir(linhas, _sessao):
+        chamadas.append([linha["n"] for linha in linhas])
+        if any(linha["n"] == 2 for linha in linhas):
+            raise ErroServidor("23503")
+        entregues.extend(linha["n"] for linha in linhas)
+
+    fila = criar_fila(_inserir)
+    ids = [fila.enfileirar({"n": n}, "t") for n in range(4)]
+    fila.flush()
+
+    assert sorted(entregues) == [0, 1, 3]
+    assert chamadas[0] == [0, 1, 2, 3]
+    assert [2] in chamadas
+    assert fila.estado(ids[0]) is None
+    assert fila.estado(ids[2]) == {"estado": "pendente", "tentativas": 1, "erro": "erro 23503"}
+
+
+def test_linha_recusada_vai_para_o_dead_letter(criar_fila, sem_espera):
+    def _inserir(_linhas, _sessao):
+        raise ErroServidor("42501")
+
+    fila = criar_fila(_inserir, max_tentativas=2)
+    item_id = fila.enfileirar({"n": 1}, "t")
+    fila.flush()
+    assert fila.estado(item_id)["estado"] == "pendente"
+    fila.flush()
+
+    assert fila.estado(item_id) == {"estado": "falhou", "erro": "erro 42501"}
+    assert fila.pendentes(lambda _p: True) == []
+    with open(fila.dead_letter, encoding="utf-8") as f:
+        registros = [json.loads(linha) for linha in f]
+    assert [registro["id"] for registro in registros] == [item_id]
+
+
+def test_falha_transitoria_adia_so_o_grupo_afetado(criar_fila):
+    tentativas = {"a": 0, "b": 0}
+    entregues = []
+
+    def _inserir(linhas, sessao):
+        tentativas[sessao] += 1
+        if sessao == "a":
+            raise ErroServidor("08006")
+        entregues.extend(linha["n"] for linha in linhas)
+
+    fila = criar_fila(_inserir)
+    id_a = fila.enfileirar({"n": 1}, "a")
+    fila.enfileirar({"n": 2}, "b")
+    fila.flush()
+    fila.enfileirar({"n": 3}, "b")
+    fila.flush()
+
+    assert entregues == [2, 3]
+    # O grupo "a" segue em backoff: o segundo flush nem tenta
+    assert tentativas["a"] == 1
+    assert fila.estado(id_a)["tentativas"] == 0
+
+
+def test_sessao_expirada_espera_novo_login_sem_dead_letter(criar_fila, sem_espera):
+    expirada = [True]
+    entregues = []
+
+    def _inserir(linhas, _sessao):
+        if expirada[0]:
+            raise SessaoExpirada("sessão expirada")
+        entregues.extend(linha["n"] for linha in linhas)
+
+    fila = criar_fila(_inserir, max_tentativas=1)
+    item_id = fila.enfileirar({"n": 1}, "token-antigo")
+    for _ in range(3):
+        fila.flush()
+
+    assert fila.estado(item_id)["estado"] == "aguardando_sessao"
+    assert not os.path.exists(fila.dead_letter)
+
+    expirada[0] = False
+    fila.flush()
+    assert entregues == [1]
+    assert fila.estado(item_id) is None
+
+
+@pytest.mark.parametrize(
+    "exc, esperado",
+    [
+        (ErroServidor("PGRST301"), True),
+        (ErroServidor("PGRST303"), True),
+        (SessaoExpirada("x"), True),
+        (ErroServidor("42501"), False),
+        (ErroServidor("08006"), False),
+    ],
+)
+def test_sessao_expirada_reconhece_erros_de_jwt(exc, esperado):
+    assert sessao_expirada(exc) is esperado
+
+
+def test_adota_journal_orfao_e_ignora_o_de_processo_vivo(criar_fila, tmp_path):
+    def _add(item_id, n):
+        registro = {"op": "add", "id": item_id, "payload": {"n": n}, "sessao": "t"}
+        return json.dumps(registro) + "\n"
+
+    orfao = tmp_path / "messages-outro-host-1.jsonl"
+    orfao.write_text(_add("a", 1) + _add("b", 2) + json.dumps({"op": "ack", "ids": ["a"]}) + "\n")
+    vivo = tmp_path / "messages-vivo-2.jsonl"
+    vivo.write_text(_add("c", 3))
+    trava = write_behind._travar(f"{vivo}.lock")
+    try:
+        fila = criar_fila(lambda _linhas, _sessao: None)
+
+        assert fila.pendentes(lambda _p: True) == [{"n": 2}]
+        assert not orfao.exists()
+        assert vivo.exists()
+    finally:
+        os.close(trava)
+
+
+def test_encerrar_envia_o_resto_e_limpa_o_journal(criar_fila):
+    entregues = []
+    fila = criar_fila(lambda linhas, _sessao: entregues.extend(linhas))
+    fila.enfileirar({"n": 1}, "t")
+    fila.encerrar()
+
+    assert entregues == [{"n": 1}]
+    assert not os.path.exists(fila.journal)
+    assert not os.path.exists(f"{fila.journal}.lock")
+
+
+def test_journal_com_pendencias_sobrevive_ao_reinicio(criar_fila):
+    def _falhar(_linhas, _sessao):
+        raise ErroServidor("08006")
+
+    fila = criar_fila(_falhar)
+    fila.enfileirar({"n": 1}, "t")
+    fila.encerrar()
+    assert os.path.exists(fila.journal)
+
+    entregues = []
+    nova = criar_fila(lambda linhas, _sessao: entregues.extend(linhas))
+    assert nova.pendentes(lambda _p: True) == [{"n": 1}]
+    nova.flush()
+    assert entregues == [{"n": 1}]
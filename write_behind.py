@@ -0,0 +1,383 @@
+"""Fila write-behind com journal local: agrupa inserts em lotes e sobrevive a reinícios."""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Teto (s) do backoff de um grupo ou de uma linha rejeitada
+_ESPERA_MAX = 30.0
+# Códigos Postgres/PostgREST de falha de conexão ou recurso: transitórios
+_CODIGOS_TRANSITORIOS = ("08", "53", "57", "PGRST0")
+# Códigos PostgREST de JWT expirado ou inválido
+_CODIGOS_SESSAO = ("PGRST301", "PGRST303")
+# Quantas linhas do dead-letter ficam consultáveis por id em memória
+_MAX_FALHAS = 1000
+
+
+class SessaoExpirada(RuntimeError):
+    """A sessão com que as linhas foram enfileiradas expirou e não há outra válida."""
+
+
+def sessao_expirada(exc: BaseException) -> bool:
+    """Se o servidor recusou o token da sessão, e não os dados."""
+    if isinstance(exc, SessaoExpirada):
+        return True
+    if getattr(exc, "code", None) in _CODIGOS_SESSAO:
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status == 401 and "expired" in str(exc).lower()
+
+
+def erro_permanente(exc: BaseException) -> bool:
+    """Se o servidor rejeitou os dados (FK, RLS, token inválido), e não a conexão."""
+    codigo = getattr(exc, "code", None)
+    if isinstance(codigo, str) and codigo:
+        return not codigo.startswith(_CODIGOS_TRANSITORIOS)
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 429)
+
+
+def _travar(caminho: str) -> Optional[int]:
+    """Trava exclusiva sem espera no arquivo; retorna o fd (mantido aberto) ou None."""
+    fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _remover(caminho: str):
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+
+class WriteBehindQueue:
+    """Acumula linhas e chama `inserir_lote` por tamanho, por tempo ou no encerramento.
+
+    Cada linha é gravada no journal (JSONL) antes de entrar na fila e marcada como
+    confirmada após o insert. Cada processo tem o próprio journal
+    (`<pasta>/<nome>-<host>-<pid>.jsonl`), travado enquanto ele vive; na
+    inicialização, journals sem dono (processos encerrados) são adotados e suas
+    linhas sem confirmação, reenviadas. A entrega é "pelo menos uma vez": uma queda entre o insert e a
+    confirmação pode duplicar o lote no reenvio.
+
+    Um lote rejeitado pelo servidor é dividido ao meio até isolar as linhas
+    ruins, que esperam com backoff próprio e, após `max_tentativas`, vão para o
+    dead-letter (`<journal>.dead`). Falhas transitórias adiam só o grupo
+    (sessão) afetado. Uma sessão expirada (`expirada`) também só adia o grupo,
+    sem contar tentativas: as linhas esperam um novo login em vez de irem para
+    o dead-letter. `estado(id)` informa ao app o que aconteceu com cada linha.
+
+    `inserir_lote(linhas, sessao)` recebe a sessão (ex.: access token) com que
+    as linhas foram enfileiradas, para enviá-las em nome de quem as gerou.
+    """
+
+    def __init__(
+        self,
+        inserir_lote: Callable[[List[Dict[str, Any]], Optional[str]], Any],
+        pasta: str,
+        nome: str,
+        max_lote: int = 50,
+        intervalo: float = 0.5,
+        fsync: bool = True,
+        max_tentativas: int = 5,
+        permanente: Callable[[BaseException], bool] = erro_permanente,
+        expirada: Callable[[BaseException], bool] = sessao_expirada,
+    ):
+        self.inserir_lote = inserir_lote
+        self.pasta = pasta
+        self.nome = nome
+        self.max_lote = max_lote
+        self.intervalo = intervalo
+        self.fsync = fsync
+        self.max_tentativas = max_tentativas
+        self.permanente = permanente
+        self.expirada = expirada
+
+        self._itens: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._parar = False
+        # Backoff por grupo: {chave da sessão: (falhas seguidas, próxima tentativa)}
+        self._backoff: Dict[Optional[str], Tuple[int, float]] = {}
+        # Linhas que foram para o dead-letter: {id: mensagem de erro}
+        self._falhas: Dict[str, str] = {}
+
+        os.makedirs(pasta, exist_ok=True)
+        base = os.path.join(pasta, f"{nome}-{socket.gethostname()}-{os.getpid()}")
+        self._trava = _travar(f"{base}.jsonl.lock")
+        if self._trava is None:
+            # Mesmo host e pid em uso (ex.: contêineres com o mesmo hostname)
+            base = f"{base}-{uuid.uuid4().hex[:8]}"
+            self._trava = _travar(f"{base}.jsonl.lock")
+        self.journal = f"{base}.jsonl"
+        self.dead_letter = f"{self.journal}.dead"
+
+        self._itens = self._ler_journal(self.journal) + self._adotar_orfaos()
+        self._reescrever_journal()
+
+        self._thread = threading.Thread(target=self._loop, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.encerrar)
+
+    def _adotar_orfaos(self) -> List[Dict[str, Any]]:
+        """Linhas pendentes de journals cujo processo dono não está mais vivo."""
+        candidatos = glob.glob(os.path.join(self.pasta, f"{self.nome}-*.jsonl"))
+        # Journal único usado antes da separação por processo
+        candidatos.append(os.path.join(self.pasta, f"{self.nome}.jsonl"))
+
+        adotados: List[Dict[str, Any]] = []
+        for caminho in candidatos:
+            if caminho == self.journal or not os.path.exists(caminho):
+                continue
+            trava = _travar(f"{caminho}.lock")
+            if trava is None:
+                continue  # dono ainda vivo
+            try:
+                adotados.extend(self._ler_journal(caminho))
+                _remover(caminho)
+            finally:
+                os.close(trava)
+                _remover(f"{caminho}.lock")
+        return adotados
+
+    def _ler_journal(self, caminho: str) -> List[Dict[str, Any]]:
+        if not os.path.exists(caminho):
+            return []
+        pendentes: Dict[str, Dict[str, Any]] = {}
+        with open(caminho, "r", encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except ValueError:
+                    # Última linha truncada por uma queda durante a escrita
+                    continue
+                if registro.get("op") == "add":
+                    sessao = registro.get("sessao")
+                    if isinstance(sessao, list):
+                        # Formato antigo guardava (access, refresh)
+                        sessao = sessao[0] if sessao else None
+                    pendentes[registro["id"]] = {
+                        "id": registro["id"],
+                        "payload": registro["payload"],
+                        "sessao": sessao,
+                    }
+                elif registro.get("op") == "ack":
+                    for item_id in registro.get("ids", []):
+                        pendentes.pop(item_id, None)
+        if pendentes:
+            logger.info("Reenviando %d linhas pendentes do journal %s", len(pendentes), caminho)
+        return list(pendentes.values())
+
+    def _escrever(self, registros: List[Dict[str, Any]], modo: str = "a", caminho: Optional[str] = None):
+        # O journal pode conter tokens de sessão: só o dono do processo lê
+        fd = os.open(
+            caminho or self.journal,
+            os.O_WRONLY | os.O_CREAT | (os.O_APPEND if modo == "a" else os.O_TRUNC),
+            0o600,
+        )
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def _registro_add(item: Dict[str, Any]) -> Dict[str, Any]:
+        # Só o que identifica a linha vai ao journal; tentativas e backoff ficam em memória
+        return {"op": "add", "id": item["id"], "payload": item["payload"], "sessao": item["sessao"]}
+
+    def _reescrever_journal(self):
+        self._escrever([self._registro_add(item) for item in self._itens], modo="w")
+
+    def enfileirar(self, payload: Dict[str, Any], sessao: Optional[str] = None) -> str:
+        """Registra a linha no journal e a coloca na fila; retorna o id local."""
+        item = {"id": uuid.uuid4().hex, "payload": payload, "sessao": sessao}
+        with self._cond:
+            self._escrever([self._registro_add(item)])
+            self._itens.append(item)
+            if len(self._itens) >= self.max_lote:
+                self._cond.notify()
+        return item["id"]
+
+    def pendentes(self, filtro: Callable[[Dict[str, Any]], bool]) -> List[Dict[str, Any]]:
+        """Payloads ainda não enviados que satisfazem `filtro` (leitura das próprias escritas)."""
+        with self._cond:
+            return [dict(item["payload"]) for item in self._itens if filtro(item["payload"])]
+
+    def estado(self, item_id: str) -> Optional[Dict[str, Any]]:
+        """Situação da linha `item_id`; None se já foi enviada (ou é desconhecida).
+
+        `estado` é "pendente", "aguardando_sessao" (sessão expirada, espera novo
+        login) ou "falhou" (recusada pelo servidor e movida para o dead-letter).
+        """
+        with self._cond:
+            if item_id in self._falhas:
+                return {"estado": "falhou", "erro": self._falhas[item_id]}
+            for item in self._itens:
+                if item["id"] == item_id:
+                    return {
+                        "estado": "aguardando_sessao" if item.get("sessao_expirada") else "pendente",
+                        "tentativas": item.get("tentativas", 0),
+                        "erro": item.get("erro"),
+                    }
+        return None
+
+    def descartar(self, filtro: Callable[[Dict[str, Any]], bool]) -> int:
+        """Remove da fila (e do journal) as linhas que satisfazem `filtro`; retorna quantas.
+
+        Espera o flush em andamento: um lote já copiado da fila não chega ao
+        servidor depois que descartar() retorna.
+        """
+        with self._flush_lock, self._cond:
+            descartados = [item["id"] for item in self._itens if filtro(item["payload"])]
+            if descartados:
+                ids = set(descartados)
+                self._itens = [item for item in self._itens if item["id"] not in ids]
+                self._escrever([{"op": "ack", "ids": sorted(ids)}])
+        return len(descartados)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._parar or len(self._itens) >= self.max_lote,
+                    timeout=self.intervalo,
+                )
+                if self._parar:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Envia o que está na fila, em lotes agrupados pela sessão de origem.
+
+        Grupos e linhas ainda em backoff ficam para um próximo flush.
+        """
+        with self._flush_lock:
+            agora = time.monotonic()
+            with self._cond:
+                itens = [item for item in self._itens if item.get("proxima", 0.0) <= agora]
+            if not itens:
+                return
+
+            grupos: Dict[Optional[str], List[Dict[str, Any]]] = {}
+            for item in itens:
+                grupos.setdefault(item["sessao"], []).append(item)
+
+            for sessao, grupo in grupos.items():
+                if self._backoff.get(sessao, (0, 0.0))[1] > agora:
+                    continue
+                for inicio in range(0, len(grupo), self.max_lote):
+                    if not self._enviar(sessao, grupo[inicio:inicio + self.max_lote]):
+                        break
+
+    def _espera(self, falhas: int) -> float:
+        return min(_ESPERA_MAX, self.intervalo * (2 ** falhas))
+
+    def _enviar(self, sessao: Optional[str], lote: List[Dict[str, Any]]) -> bool:
+        """Envia `lote`; retorna False se uma falha transitória adiou o grupo."""
+        try:
+            self.inserir_lote([item["payload"] for item in lote], sessao)
+        except Exception as exc:
+            expirada = self.expirada(exc)
+            for item in lote:
+                item["erro"] = str(exc)
+                item["sessao_expirada"] = expirada
+            if expirada:
+                # Reenviar não adianta até haver um token válido; sem dead-letter
+                falhas = self._backoff.get(sessao, (0, 0.0))[0] + 1
+                self._backoff[sessao] = (falhas, time.monotonic() + self._espera(falhas))
+                logger.warning("Sessão expirada: %d linhas aguardando novo login", len(lote))
+                return False
+            if not self.permanente(exc):
+                falhas = self._backoff.get(sessao, (0, 0.0))[0] + 1
+                self._backoff[sessao] = (falhas, time.monotonic() + self._espera(falhas))
+                logger.warning("Falha ao enviar lote de %d linhas: %s", len(lote), exc)
+                return False
+            if len(lote) > 1:
+                # Divide ao meio até isolar as linhas que o servidor recusa
+                meio = len(lote) // 2
+                return self._enviar(sessao, lote[:meio]) and self._enviar(sessao, lote[meio:])
+            self._rejeitar(lote[0], exc)
+            return True
+
+        self._backoff.pop(sessao, None)
+        self._confirmar(lote)
+        return True
+
+    def _rejeitar(self, item: Dict[str, Any], exc: BaseException):
+        item["tentativas"] = item.get("tentativas", 0) + 1
+        if item["tentativas"] < self.max_tentativas:
+            item["proxima"] = time.monotonic() + self._espera(item["tentativas"])
+            logger.warning("Linha %s recusada (tentativa %d): %s", item["id"], item["tentativas"], exc)
+            return
+
+        logger.error("Linha %s movida para o dead-letter após %d tentativas: %s", item["id"], item["tentativas"], exc)
+        with self._cond:
+            self._escrever(
+                [{"id": item["id"], "payload": item["payload"], "erro": str(exc), "em": time.time()}],
+                caminho=self.dead_letter,
+            )
+            if len(self._falhas) >= _MAX_FALHAS:
+                self._falhas.pop(next(iter(self._falhas)))
+            self._falhas[item["id"]] = str(exc)
+        self._confirmar([item])
+
+    def _confirmar(self, lote: List[Dict[str, Any]]):
+        enviados = {item["id"] for item in lote}
+        with self._cond:
+            self._itens = [item for item in self._itens if item["id"] not in enviados]
+            if self._itens:
+                self._escrever([{"op": "ack", "ids": sorted(enviados)}])
+            else:
+                self._reescrever_journal()
+
+    def encerrar(self):
+        """Para a thread e faz um último flush (registrado no atexit)."""
+        with self._cond:
+            if self._parar:
+                return
+            self._parar = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self.flush()
+
+        with self._cond:
+            vazio = not self._itens
+        if self._trava is not None:
+            os.close(self._trava)
+            self._trava = None
+        if vazio:
+            # Nada a reenviar: o journal deste processo não precisa sobreviver a ele
+            _remover(self.journal)
+            _remover(f"{self.journal}.lock")
+
+
+__all__ = ["WriteBehindQueue", "SessaoExpirada", "erro_permanente", "sessao_expirada"]